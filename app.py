@@ -1,10 +1,73 @@
 import streamlit as st
 import pandas as pd
 import datetime
-from pace_planner import GPXAnalyzer, PaceCalculator, MapVisualizer
+import json
+from pace_planner import MapVisualizer, PaceCalculator, add_time_strings, format_duration
+from route_cache import RouteCache, RouteCatalog, route_geometry_hash
+from pipeline import AnalysisPipeline
+from simulation import simulate_race
+from profiling import RunProfile, profile_stage
 from misc_functions import convert_to_mph, convert_to_kmh, convert_to_km,\
-    convert_to_miles, dynamic_input_data_editor, generate_gpx_analysis_pdf \
-        , merge_custom_markers, plotly_elevation_plot, plotly_pace_plot, calculate_time_difference
+    convert_to_miles, dynamic_input_data_editor, generate_gpx_analysis_pdf, create_static_map_image \
+        , plotly_elevation_plot, plotly_pace_plot, parse_duration, parse_pace
+
+# Parsed, distance-annotated routes shared by uploads and saved routes
+route_cache = RouteCache()
+route_catalog = RouteCatalog("saved_routes")
+
+# Rendered maps are shared by every session, the least recently used ones are dropped first
+MAP_CACHE_ENTRIES = 32
+
+@st.cache_data(max_entries=MAP_CACHE_ENTRIES, show_spinner=False)
+def route_map_html(route_geometry, show_arrows, _final_df):
+    """
+    Folium map HTML of an analyzed route. The map only shows the track and km markers,
+    so it is keyed on the route_geometry_hash of the track and the arrow option, and
+    _final_df (not hashed) is only read when the map is not cached yet.
+    """
+    map_viz = MapVisualizer(_final_df)
+    map_viz.create_base_map()
+
+    # Add markers based on user preference
+    if show_arrows:
+        map_viz.add_kilometer_markers_directional()
+    else:
+        map_viz.add_kilometer_markers()
+    return map_viz.to_html()
+
+# Route images for the PDF report, one per route and image size
+STATIC_MAP_CACHE_ENTRIES = 32
+
+@st.cache_data(max_entries=STATIC_MAP_CACHE_ENTRIES, show_spinner=False)
+def static_map_png(route_geometry, _final_df, width_inches=6, height_inches=3):
+    """PNG route image keyed on the route and image size, independent of notes and units so it outlives them"""
+    return create_static_map_image(_final_df, show_arrows=True, width_inches=width_inches,
+                                   height_inches=height_inches).getvalue()
+
+# Finished PDF reports, keyed on everything printed in them
+PDF_CACHE_ENTRIES = 16
+
+@st.cache_data(max_entries=PDF_CACHE_ENTRIES, show_spinner=False)
+def pdf_report_bytes(km_data, total_distance, pace_minutes, pace_seconds, finish_time, total_elevation_gain,
+                     use_metric, route_name, route_geometry, _analyzer):
+    """
+    PDF report bytes. km_data holds the analysed splits with the notes, so together with the
+    summary values and the unit setting it keys the cache, _analyzer (not hashed) only
+    supplies the route for the static map image.
+    """
+    map_image = static_map_png(route_geometry, _analyzer.final_df)
+    return generate_gpx_analysis_pdf(
+        analyzer=_analyzer,
+        km_data=km_data,
+        total_distance=total_distance,
+        pace_minutes=pace_minutes,
+        pace_seconds=pace_seconds,
+        finish_time=finish_time,
+        total_elevation_gain=total_elevation_gain,
+        use_metric=use_metric,
+        route_name=route_name,
+        map_image=map_image
+    ).getvalue()
 
 def main():
     st.set_page_config(
@@ -16,6 +79,9 @@ def main():
     st.write("Upload a GPX file, analyze your race pace strategy, and optionally generate a pdf report!")
 
     st.page_link("pages/tutorial.py", label="**:blue[Click Here to View Tutorial]**")
+
+    # Hidden performance panel, open the app with ?debug=1 to show it
+    debug_mode = st.query_params.get("debug") == "1"
     
     # Create two columns for Route Selection and Analysis Configuration
     main_col1, main_col2 = st.columns(2)
@@ -25,7 +91,7 @@ def main():
         st.subheader("Route Selection")
         route_source = st.radio("Choose route source:", ["Upload new file", "Use saved route"])
         
-        selected_file_path = None
+        selected_gpx = None  # saved route path or uploaded file content
         
         if route_source == "Upload new file":
             uploaded_file = st.file_uploader("Choose a GPX file", type=['gpx'])
@@ -40,46 +106,61 @@ def main():
                         del st.session_state.analysis_complete
                     if 'analyzer' in st.session_state:
                         del st.session_state.analyzer
-                    if 'current_show_arrows' in st.session_state:
-                        del st.session_state.current_show_arrows
                     if 'km_notes' in st.session_state:
                         del st.session_state.km_notes
                     
                     # Store the new file name
                     st.session_state.last_uploaded_file = current_file_name
                 
-                # Save uploaded file temporarily
-                with open("temp_route.gpx", "wb") as f:
-                    f.write(uploaded_file.getbuffer())
-                selected_file_path = "temp_route.gpx"
+                # Parse the upload straight from this session's memory, nothing is written to disk.
+                # getvalue() shares the upload's bytes, getbuffer() would copy them first
+                selected_gpx = uploaded_file.getvalue()
                 st.success(f"File uploaded: {uploaded_file.name}")
         else:
-            # Show saved routes
+            # Show saved routes from the catalog (route stats without parsing any GPX)
             import os
             saved_routes_dir = "saved_routes"
             if os.path.exists(saved_routes_dir):
-                gpx_files = sorted([f for f in os.listdir(saved_routes_dir) if f.endswith('.gpx')], key=str.lower)
-                if gpx_files:
-                    selected_route = st.selectbox("Select a saved route:", gpx_files)
-                    selected_file_path = os.path.join(saved_routes_dir, selected_route)
+                route_catalog.refresh()
+                catalog_df = route_catalog.to_dataframe()
+                if not catalog_df.empty:
+                    # Filter routes by distance when the library has a spread of distances
+                    min_km = float(catalog_df['total_distance'].min())
+                    max_km = float(catalog_df['total_distance'].max())
+                    if max_km - min_km >= 1:
+                        distance_range = st.slider("Filter by distance (km)", min_value=int(min_km), 
+                                                   max_value=int(max_km) + 1, value=(int(min_km), int(max_km) + 1))
+                        # unreadable files have no distance, keep them listed
+                        catalog_df = catalog_df[catalog_df['total_distance'].between(*distance_range) |
+                                                catalog_df['error'].notna()]
+
+                    route_labels = {
+                        row['file_name']: f"{row['file_name']} (could not be read)" if pd.notna(row['error']) else
+                                          f"{row['file_name']} ({row['total_distance']:.1f} km, "
+                                          f"+{row['elevation_gain']:.0f}/-{row['elevation_loss']:.0f} m)"
+                        for _, row in catalog_df.iterrows()
+                    }
+                    selected_route = st.selectbox("Select a saved route:", list(route_labels), format_func=route_labels.get)
+
+                    if selected_route is not None:
+                        selected_gpx = os.path.join(saved_routes_dir, selected_route)
                     
-                    # Check if this is a different saved route
-                    if ('last_selected_route' not in st.session_state or 
-                        st.session_state.last_selected_route != selected_route):
+                        # Check if this is a different saved route
+                        if ('last_selected_route' not in st.session_state or 
+                            st.session_state.last_selected_route != selected_route):
                         
-                        # Clear previous analysis when route changes
-                        if 'analysis_complete' in st.session_state:
-                            del st.session_state.analysis_complete
-                        if 'analyzer' in st.session_state:
-                            del st.session_state.analyzer
-                        if 'current_show_arrows' in st.session_state:
-                            del st.session_state.current_show_arrows
-                        if 'km_notes' in st.session_state:
-                            del st.session_state.km_notes
-                        
-                        # Store the new route name
-                        st.session_state.last_selected_route = selected_route
+                            # Clear previous analysis when route changes
+                            if 'analysis_complete' in st.session_state:
+                                del st.session_state.analysis_complete
+                            if 'analyzer' in st.session_state:
+                                del st.session_state.analyzer
+                            if 'km_notes' in st.session_state:
+                                del st.session_state.km_notes
                         
+                            # Store the new route name
+                            st.session_state.last_selected_route = selected_route
+                    else:
+                        st.warning("No saved routes match the distance filter.")
                 else:
                     st.warning("No saved routes found. Add GPX files to the 'saved_routes' folder.")
             else:
@@ -106,8 +187,11 @@ def main():
             with st.container():
                 st.write("**Pace Configuration**")
                 
+                # Either set the base pace directly or solve it from a goal finish time
+                pace_mode = st.radio("Pace input:", ["Base pace", "Target finish time"], horizontal=True)
                 # Single time input that works for both units
                 pace_time = st.time_input("Base pace (min:sec)", datetime.time(6, 12, 0))
+                target_time_str = st.text_input("Target finish time (HH:MM:SS)", "04:30:00")
                 race_start = st.time_input("Race start time", None, step=300)
             
             # Advanced Options Container
@@ -121,19 +205,28 @@ def main():
                 with adv_col2:
                     enable_hills = st.checkbox("Enable hill adjustments", value=True)
 
+                # Replan the paces so every custom marker cutoff is cleared with the most even effort
+                optimize_cutoffs = st.checkbox("Plan pacing to clear cutoffs", value=False)
+                cutoff_safety_buffer = st.number_input("Cutoff safety buffer (minutes)", min_value=0, max_value=240, value=15, step=5)
+
+                # Drop trackpoints within this many metres of the simplified line, 0 keeps every point
+                simplify_tolerance = st.number_input("Simplify track (tolerance in m, 0 = off)", min_value=0.0, max_value=50.0, value=0.0, step=0.5)
+
             with st.expander("Custom Marker Configuration"):
                 st.write("Add custom markers at specific distances with nicknames and optional cutoff times. These will be used for output in the pace table.")
                 st.write("E.g., Distance: 5.0, Nickname: Water Station, Cutoff Time: 10:00:00")
                 # Data editor for custom markers
                 custom_marker_distance_type = st.checkbox("Using KM markers?", value=True)
+                exact_marker_placement = st.checkbox("Place markers at their exact distance (instead of the nearest km marker)", value=False)
+                gpx_waypoints = st.checkbox("Add the GPX file's waypoints as markers", value=False)
                 custom_marker_data = st.data_editor(pd.DataFrame(columns=["Distance", "Nickname","Cutoff Time"]), num_rows="dynamic", use_container_width=True)
             
             # Submit button
             st.markdown("---")
-            submitted = st.form_submit_button("🚀 Analyze Route", disabled=(selected_file_path is None), use_container_width=True)
+            submitted = st.form_submit_button("🚀 Analyze Route", disabled=(selected_gpx is None), use_container_width=True)
         
     # Process form submission
-    if submitted and selected_file_path is not None:
+    if submitted and selected_gpx is not None:
         # Process pace input outside form to avoid reset issues
         pace_minutes = pace_time.hour + (pace_time.minute / 60.0)
         # Convert to km/h if needed (our internal format is always min/km)
@@ -141,49 +234,54 @@ def main():
             base_pace = convert_to_kmh(pace_minutes)
         else:
             base_pace = pace_minutes
+
+        # In target mode the pipeline solves the base pace for the goal finish time
+        target_minutes = None
+        if pace_mode == "Target finish time":
+            try:
+                target_minutes = parse_duration(target_time_str)
+            except ValueError as e:
+                st.error(str(e))
+                st.stop()
             
         # Clear any previous session state data
         if 'analysis_complete' in st.session_state:
             del st.session_state.analysis_complete
         if 'analyzer' in st.session_state:
             del st.session_state.analyzer
-        if 'current_show_arrows' in st.session_state:
-            del st.session_state.current_show_arrows
+        if 'simulation' in st.session_state:
+            del st.session_state.simulation
             
         with st.spinner("Processing GPX file..."):
             try:
-                # Initialize analyzer
-                analyzer = GPXAnalyzer(selected_file_path)
-                analyzer.load_gpx()
-                analyzer.map_adjustment(loops=loops)
-                analyzer.calculate_distances()
-                analyzer.find_kilometer_markers()
-                
-                # Calculate pace
-                pace_calc = PaceCalculator(analyzer, base_pace)
-                pace_calc.calculate_pace(
-                    decay=enable_decay, hill_mode=enable_hills
-                )
-                pace_calc.calculate_times()
-                pace_calc.calculate_clock_times(race_start)
-
-                # Merge custom markers if provided
-                if not custom_marker_data.empty and len(custom_marker_data) > 0:
-                    analyzer.final_df = merge_custom_markers(
-                        analyzer.final_df, 
-                        custom_marker_data, 
-                        use_km_markers=custom_marker_distance_type
+                # Each session keeps its own pipeline so only stages whose inputs changed are rerun
+                if 'pipeline' not in st.session_state:
+                    st.session_state.pipeline = AnalysisPipeline(cache=route_cache)
+
+                with RunProfile("analysis", track_memory=debug_mode) as analysis_profile:
+                    analyzer = st.session_state.pipeline.run(
+                        selected_gpx,
+                        loops=loops,
+                        base_pace=base_pace,
+                        decay=enable_decay,
+                        hill_mode=enable_hills,
+                        race_start=race_start,
+                        custom_markers=custom_marker_data,
+                        use_km_markers=custom_marker_distance_type,
+                        exact_marker_placement=exact_marker_placement,
+                        target_time=target_minutes,
+                        optimize_cutoffs=optimize_cutoffs,
+                        cutoff_safety_buffer=cutoff_safety_buffer,
+                        gpx_waypoints=gpx_waypoints,
+                        simplify_tolerance=simplify_tolerance
                     )
-                    
-                    # Calculate cutoff buffer if cutoff times exist
-                    if 'cutoff_time_formatted' in analyzer.final_df.columns:
-                        analyzer.final_df['cutoff_buffer_minutes'] = analyzer.final_df.apply(calculate_time_difference, axis=1)
+                st.session_state.analysis_profile = analysis_profile
                 
                 # Store results in session state
                 st.session_state.analysis_complete = True
                 st.session_state.analyzer = analyzer
-                st.session_state.current_show_arrows = True  # Default value
-                st.session_state.map_needs_regeneration = True  # Force map regeneration
+                st.session_state.route_geometry = route_geometry_hash(analyzer.final_df)
+                st.session_state.target_minutes = target_minutes
                 
             except Exception as e:
                 st.error(f"Error processing file: {str(e)}")
@@ -193,6 +291,10 @@ def main():
     if st.session_state.get('analysis_complete', False):
 
         analyzer = st.session_state.analyzer
+        route_geometry = st.session_state.route_geometry
+
+        # Timing of the PDF and map stages of this rerun
+        render_profile = RunProfile("render", track_memory=debug_mode)
         
         # Display results
         st.success("Analysis complete!")
@@ -206,8 +308,8 @@ def main():
         # Calculate values once
         total_distance = analyzer.final_df['total_distance'].max()
         avg_pace = analyzer.final_df['pace'].mean()
-        finish_time = analyzer.final_df['cumulative_time_hms'].iloc[-1]
-        uphill, downhill = analyzer.gpx_parsed.get_uphill_downhill()
+        finish_time = format_duration([analyzer.final_df['cumulative_time'].iloc[-1]])[0]
+        uphill, downhill = analyzer.uphill, analyzer.downhill
         total_elevation_gain = uphill * loops if uphill else 0
         total_elevation_loss = downhill * loops if downhill else 0
         
@@ -245,6 +347,47 @@ def main():
                 elevation_loss_ft = total_elevation_loss * 3.28084
                 st.metric("Elevation Gain/Loss", f"{elevation_gain_ft:.0f}/{elevation_loss_ft:.0f} ft", border=True)
 
+        # Show the base pace that was solved for the target finish time
+        if st.session_state.get('target_minutes') is not None and analyzer.base_pace is not None:
+            solved_pace = analyzer.base_pace if use_metric else convert_to_mph(analyzer.base_pace)
+            solved_minutes = int(solved_pace)
+            solved_seconds = int((solved_pace - solved_minutes) * 60)
+            target_str = format_duration([st.session_state.target_minutes])[0]
+            st.info(f"Base pace for a {target_str} finish: {solved_minutes}:{solved_seconds:02d} "
+                    f"{'min/km' if use_metric else 'min/mile'}")
+
+        # Show how much the simplified track differs from the full one (single lap)
+        if analyzer.simplification is not None:
+            report = analyzer.simplification
+            gain_before, gain_after, gain_unit = report['elevation_gain_before_m'], report['elevation_gain_after_m'], "m"
+            if not use_metric:
+                gain_before, gain_after, gain_unit = gain_before * 3.28084, gain_after * 3.28084, "ft"
+            st.info(f"Track simplified to {report['tolerance_m']:g} m: {report['points_before']:,} → {report['points_after']:,} points, "
+                    f"distance {report['distance_change_pct']:+.2f}%, elevation gain {gain_before:.0f} → {gain_after:.0f} {gain_unit}")
+
+        # Cutoffs earlier than the one before them on a race that ends the same day are most likely typos
+        if 'cutoff_out_of_order' in analyzer.final_df.columns and analyzer.final_df['cutoff_out_of_order'].any():
+            out_of_order = analyzer.final_df.loc[analyzer.final_df['cutoff_out_of_order'], 'custom_marker']
+            st.warning("These cutoff times are earlier than a cutoff before them, please check them: " +
+                       ", ".join(out_of_order.astype(str)))
+
+        # Show the section base paces the cutoff optimizer planned
+        if 'section_base_pace' in analyzer.final_df.columns:
+            section_pace = analyzer.final_df['section_base_pace']
+            section_start = section_pace.ne(section_pace.shift())
+            sections = pd.DataFrame({
+                'from': analyzer.final_df['total_distance'][section_start].to_numpy(),
+                'base_pace': section_pace[section_start].to_numpy(),
+            })
+            sections['to'] = list(sections['from'].iloc[1:]) + [total_distance]
+            if not use_metric:
+                sections[['from', 'to']] = convert_to_miles(sections[['from', 'to']])
+                sections['base_pace'] = convert_to_mph(sections['base_pace'])
+            distance_unit, pace_unit_label = ("km", "min/km") if use_metric else ("miles", "min/mile")
+            st.info("Pacing planned to clear every cutoff: " + ", ".join(
+                f"{start:.1f}-{end:.1f} {distance_unit} at {int(pace)}:{int((pace % 1) * 60):02d} {pace_unit_label}"
+                for start, end, pace in zip(sections['from'], sections['to'], sections['base_pace'])))
+
         # Display pace data - use custom markers if they exist, otherwise use km markers
         st.subheader("Pace Data")
         
@@ -265,20 +408,20 @@ def main():
             if 'cutoff_buffer_minutes' in analyzer.final_df.columns:
                 # Display custom markers data with cutoff buffer
                 marker_data = analyzer.final_df[
-                    (analyzer.final_df['is_km_marker'] == 1) & 
-                    (analyzer.final_df['custom_marker'].str.strip() != '')
-                ][['km_number', 'total_distance', 'pace', 'grade', 'cumulative_time_hms','clock_time', 'custom_marker','cutoff_time_formatted', 'cutoff_buffer_minutes']].copy()
+                    analyzer.final_df['custom_marker'].str.strip() != ''
+                ][['km_number', 'total_distance', 'pace', 'grade', 'cumulative_time','clock_datetime', 'custom_marker','cutoff_time_formatted', 'cutoff_buffer_minutes']].copy()
 
             else:
                 # Display custom markers data without cutoff times
                 marker_data = analyzer.final_df[
-                    (analyzer.final_df['is_km_marker'] == 1) & 
-                    (analyzer.final_df['custom_marker'].str.strip() != '')
-                ][['km_number', 'total_distance', 'pace', 'grade', 'cumulative_time_hms','clock_time', 'custom_marker']].copy()
+                    analyzer.final_df['custom_marker'].str.strip() != ''
+                ][['km_number', 'total_distance', 'pace', 'grade', 'cumulative_time','clock_datetime', 'custom_marker']].copy()
                 
-            # Add marker labels to start and finish rows
-            first_row['custom_marker'] = 'START'
-            last_row['custom_marker'] = 'FINISH'
+            # Add marker labels to start and finish rows, keeping any marker placed on them
+            # (e.g. a GPX waypoint at the start line)
+            for end_row, label in ((first_row, 'START'), (last_row, 'FINISH')):
+                marker = str(end_row['custom_marker'].iloc[0]).strip()
+                end_row['custom_marker'] = f"{label}, {marker}" if marker else label
             
             # Ensure START and FINISH rows have cutoff columns if they exist in marker_data
             if 'cutoff_time_formatted' in marker_data.columns:
@@ -299,7 +442,7 @@ def main():
             # Sort by distance first, then by marker priority (START/FINISH over custom markers)
             # Create a priority column for sorting: START=1, FINISH=1, custom markers=2
             km_data['_sort_priority'] = km_data['custom_marker'].apply(
-                lambda x: 1 if x in ['START', 'FINISH'] else 2
+                lambda x: 1 if x.split(', ')[0] in ['START', 'FINISH'] else 2
             )
             km_data = km_data.sort_values(['total_distance', '_sort_priority']).reset_index(drop=True)
             
@@ -314,7 +457,7 @@ def main():
         else:
             # Display regular km markers
             marker_data = analyzer.final_df[analyzer.final_df['is_km_marker'] == 1][
-                ['km_number', 'total_distance', 'pace', 'grade', 'cumulative_time_hms', 'clock_time']
+                ['km_number', 'total_distance', 'pace', 'grade', 'cumulative_time', 'clock_datetime']
             ].copy()
             
             # Add marker column for consistency and label start/finish
@@ -355,6 +498,9 @@ def main():
             # Clean up the temporary sort column
             km_data = km_data.drop('_sort_priority', axis=1)
         
+        # Format durations and clock times only for the rows that are shown
+        km_data = add_time_strings(km_data, analyzer.race_start_datetime)
+
         # Helper function to convert pace to MM:SS format
         def format_pace(pace_float):
             minutes = int(pace_float)
@@ -461,35 +607,40 @@ def main():
             else:
                 route_name = "GPX Route"
             
-            try:
-                # Prepare PDF data with original columns plus notes
-                pdf_data = km_data.copy()
-                pdf_data['Notes'] = st.session_state.km_notes
-                
-                # Generate PDF
-                pdf_buffer = generate_gpx_analysis_pdf(
-                    analyzer=analyzer,
-                    km_data=pdf_data,  # Use original data with all columns
-                    total_distance=total_distance,
-                    pace_minutes=pace_minutes,
-                    pace_seconds=pace_seconds,
-                    finish_time=finish_time,
-                    total_elevation_gain=total_elevation_gain,
-                    use_metric=use_metric,
-                    route_name=route_name
-                )
-                
-                # Single download button that generates and downloads
-                st.download_button(
-                    label="📄 Generate & Download PDF Report",
-                    data=pdf_buffer.getvalue(),
-                    file_name=f"{route_name}_pace_analysis.pdf",
-                    mime="application/pdf",
-                    use_container_width=True
-                )
-                
-            except Exception as e:
-                st.error(f"Error generating PDF: {str(e)}")
+            # Prepare PDF data with original columns plus notes
+            pdf_data = km_data.copy()
+            pdf_data['Notes'] = st.session_state.km_notes
+
+            # Outcome of the last PDF build. The build runs on a separate thread when the button is
+            # clicked, where Streamlit commands are ignored, so its error and timing are shown from here
+            pdf_state = st.session_state.setdefault('pdf_report', {})
+            if pdf_state.get('error'):
+                st.error(f"Error generating PDF: {pdf_state['error']}")
+
+            # Built only when the button is clicked, and only once per set of report inputs
+            def build_pdf():
+                # no memory tracking, tracemalloc is process wide and other sessions may be profiling
+                pdf_profile = RunProfile("pdf (last download)", track_memory=False)
+                try:
+                    with pdf_profile, profile_stage("pdf report", points=len(pdf_data)):
+                        pdf_bytes = pdf_report_bytes(pdf_data, total_distance, pace_minutes, pace_seconds, finish_time,
+                                                     total_elevation_gain, use_metric, route_name,
+                                                     route_geometry, analyzer)
+                except Exception as e:
+                    pdf_state['error'] = str(e)
+                    raise
+                pdf_state['error'] = None
+                pdf_state['profile'] = pdf_profile
+                return pdf_bytes
+
+            # Single download button that generates and downloads
+            st.download_button(
+                label="📄 Generate & Download PDF Report",
+                data=build_pdf,
+                file_name=f"{route_name}_pace_analysis.pdf",
+                mime="application/pdf",
+                use_container_width=True
+            )
         
         with col_download2:
             st.info("💡 Click to generate and download your complete pace analysis report with all data, metrics, and notes.")
@@ -499,31 +650,9 @@ def main():
         
         show_arrows = st.checkbox("Show directional arrows", value=True)
         
-        # Regenerate map if checkbox state changed OR if new analysis was run
-        if ('current_show_arrows' not in st.session_state or 
-            st.session_state.current_show_arrows != show_arrows or
-            st.session_state.get('map_needs_regeneration', False)):
-            
-            # Create map once
-            map_viz = MapVisualizer(analyzer.final_df)
-            map_viz.create_base_map()
-            
-            # Add markers based on user preference
-            if show_arrows:
-                map_viz.add_kilometer_markers_directional()
-            else:
-                map_viz.add_kilometer_markers()
-            
-            # Save map once
-            map_viz.save_map("route_map.html")
-            
-            # Update session state
-            st.session_state.current_show_arrows = show_arrows
-            st.session_state.map_needs_regeneration = False  # Reset flag
-
-        # Display map in Streamlit
-        with open("route_map.html", "r") as f:
-            map_html = f.read()
+        # Built only the first time any session shows this route, loop count and arrow option
+        with render_profile:
+            map_html = route_map_html(route_geometry, show_arrows, analyzer.final_df)
         st.components.v1.html(map_html, height=600)
         
         # Show elevation profile
@@ -541,8 +670,112 @@ def main():
             st.plotly_chart(pace_plot, use_container_width=True)
         else:
             st.write("No pace data available to display.")
+
+        # What-if comparison over base paces and model options, reuses the analyzed route
+        with st.expander("Scenario comparison", expanded=False):
+            unit_label = "min/km" if use_metric else "min/mile"
+            scenario_col1, scenario_col2, scenario_col3 = st.columns([2, 1, 1])
+            with scenario_col1:
+                scenario_paces_str = st.text_input(f"Base paces to compare ({unit_label}, comma separated)", "5:45, 6:00, 6:15")
+            with scenario_col2:
+                scenario_decay = st.multiselect("Fatigue decay", ["Off", "On"], default=["Off", "On"])
+            with scenario_col3:
+                scenario_hills = st.multiselect("Hill adjustments", ["Off", "On"], default=["On"])
+
+            try:
+                scenario_paces = [parse_pace(pace) for pace in scenario_paces_str.split(',') if pace.strip()]
+            except ValueError as e:
+                st.error(str(e))
+                scenario_paces = []
+
+            if scenario_paces and scenario_decay and scenario_hills:
+                # Inputs are in the display unit, the model works in min/km
+                model_paces = scenario_paces if use_metric else [convert_to_kmh(pace) for pace in scenario_paces]
+                summary, split_times = PaceCalculator(analyzer, model_paces[0]).scenario_grid(
+                    model_paces,
+                    decays=tuple(option == "On" for option in scenario_decay),
+                    hill_modes=tuple(option == "On" for option in scenario_hills)
+                )
+
+                shown_paces = summary['base_pace'] if use_metric else convert_to_mph(summary['base_pace'])
+                shown_average = summary['average_pace'] if use_metric else convert_to_mph(summary['average_pace'])
+                scenario_table = pd.DataFrame({
+                    'Base Pace': [f"{int(p)}:{int(round((p % 1) * 60)) % 60:02d}" for p in shown_paces],
+                    'Fatigue Decay': summary['decay'].map({True: "On", False: "Off"}),
+                    'Hill Adjustments': summary['hill_mode'].map({True: "On", False: "Off"}),
+                    'Finish Time': format_duration(summary['finish_minutes']),
+                    f'Average Pace ({unit_label})': [f"{int(p)}:{int((p % 1) * 60):02d}" for p in shown_average],
+                })
+                st.dataframe(scenario_table, hide_index=True, use_container_width=True)
+
+                if st.checkbox("Show split times per scenario", value=False):
+                    split_table = pd.DataFrame(
+                        {f"km {label}" if label != 'finish' else 'Finish': format_duration(split_times[label])
+                         for label in split_times.columns}
+                    )
+                    split_table.insert(0, 'Scenario', scenario_table['Base Pace'] + " | decay " +
+                                       scenario_table['Fatigue Decay'] + " | hills " + scenario_table['Hill Adjustments'])
+                    st.dataframe(split_table, hide_index=True, use_container_width=True)
+
+        # Spread of finish times and chance of missing each cutoff around the planned paces
+        with st.expander("Finish time simulation", expanded=False):
+            sim_col1, sim_col2, sim_col3 = st.columns(3)
+            with sim_col1:
+                sim_draws = st.number_input("Simulated races", min_value=1000, max_value=100000, value=10000, step=1000)
+            with sim_col2:
+                sim_split_noise = st.slider("Split pace variability (%)", 0, 30, 8)
+            with sim_col3:
+                sim_fatigue = st.slider("Fatigue variability (%)", 0, 50, 10)
+
+            if st.button("Run simulation"):
+                with render_profile:
+                    st.session_state.simulation = simulate_race(
+                        analyzer,
+                        draws=int(sim_draws),
+                        split_noise=sim_split_noise / 100,
+                        fatigue_sd=sim_fatigue / 100
+                    )
+
+            simulation = st.session_state.get('simulation')
+            if simulation is not None:
+                percentile_table = simulation['finish_percentiles'][['percentile', 'finish_time']].rename(
+                    columns={'percentile': 'Percentile', 'finish_time': 'Finish Time'})
+                st.write(f"Planned finish: {format_duration([simulation['planned_finish']])[0]}")
+                st.dataframe(percentile_table, hide_index=True, use_container_width=True)
+
+                marker_table = simulation['markers']
+                if len(marker_table):
+                    distance = marker_table['total_distance'] if use_metric else convert_to_miles(marker_table['total_distance'])
+                    risk_table = pd.DataFrame({
+                        'Marker': marker_table['custom_marker'],
+                        'Distance (km)' if use_metric else 'Distance (miles)': distance.round(1),
+                        'Cutoff Time': marker_table['cutoff_time_formatted'],
+                        'Planned Arrival': format_duration(marker_table['planned_minutes']),
+                        'Slow Day Arrival (p90)': format_duration(marker_table['p90_minutes']),
+                        'Miss Probability': (marker_table['miss_probability'] * 100).map(lambda x: f"{x:.1f}%"),
+                    })
+                    st.dataframe(risk_table, hide_index=True, use_container_width=True)
+                else:
+                    st.info("Add custom markers with cutoff times to see the chance of missing each cutoff.")
+
+        if debug_mode:
+            with st.expander("Debug: performance profile", expanded=False):
+                profiles = [p for p in [st.session_state.get('analysis_profile'), render_profile,
+                                        st.session_state.get('pdf_report', {}).get('profile')] if p is not None]
+                if 'pipeline' in st.session_state:
+                    st.write("**Pipeline stages (last run)**")
+                    st.json(st.session_state.pipeline.stage_status)
+                for profile in profiles:
+                    st.write(f"**{profile.name}** ({profile.total_ms:.1f} ms)")
+                    st.dataframe(profile.to_dataframe(), hide_index=True, use_container_width=True)
+                st.download_button(
+                    label="Export profile JSON",
+                    data=json.dumps([profile.to_dict() for profile in profiles], indent=2, default=str),
+                    file_name="gpx_planner_profile.json",
+                    mime="application/json"
+                )
     
-    elif submitted and selected_file_path is None:
+    elif submitted and selected_gpx is None:
         st.error("Please select a GPX file before analyzing ")
     else:
         st.info("Please select a GPX file before analyzing!")
@@ -0,0 +1,243 @@
+#Benchmark harness for the GPX Pace Planner analysis pipeline
+#
+# Times every stage and the end-to-end analysis from GPXAnalyzer.load_gpx through
+# generate_gpx_analysis_pdf, over every file in saved_routes/ plus synthetic tracks.
+#
+#Usage (from the repo root)
+# python benchmarks/run_benchmarks.py                     # compare against benchmarks/baseline.json
+# python benchmarks/run_benchmarks.py --save-baseline     # record a new baseline
+# python benchmarks/run_benchmarks.py --sizes 10000 --loops 1 --no-saved-routes --memory
+#
+# Exits with status 1 when any stage is slower than the baseline by more than --tolerance,
+# so it can gate a deploy. Baselines are machine specific, record one on the machine you compare on.
+import os
+import sys
+import gc
+import json
+import time
+import argparse
+import datetime
+import platform
+import tempfile
+
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from pace_planner import GPXAnalyzer, PaceCalculator, MapVisualizer, add_time_strings
+from misc_functions import generate_gpx_analysis_pdf
+from profiling import RunProfile
+
+SAVED_ROUTES_DIR = os.path.join(REPO_ROOT, 'saved_routes')
+DEFAULT_BASELINE = os.path.join(REPO_ROOT, 'benchmarks', 'baseline.json')
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+DEFAULT_LOOPS = [1, 5]
+
+
+def write_synthetic_gpx(path, n_points, course_km: float = 160.0, seed: int = 0):
+    """
+    Write a synthetic single-segment GPX track: a closed, wobbly loop of course_km with
+    rolling hills, so any point count gives a realistic 100 mile course
+
+    Args:
+        path (str): Output file path
+        n_points (int): Number of trackpoints
+        course_km (float): Approximate course length in km
+        seed (int): Seed for the noise added to the track
+    """
+    rng = np.random.default_rng(seed)
+    theta = np.linspace(0, 2 * np.pi, n_points)
+    radius_km = course_km / (2 * np.pi)
+    wobble = 1 + 0.05 * np.sin(7 * theta)
+
+    lat0, lon0 = 35.0, -101.0
+    lats = lat0 + (radius_km * wobble * np.sin(theta)) / 111.32
+    lons = lon0 + (radius_km * wobble * np.cos(theta)) / (111.32 * np.cos(np.radians(lat0)))
+    lats += rng.normal(0, 1e-6, n_points)
+    lons += rng.normal(0, 1e-6, n_points)
+    elevation = 900 + 120 * np.sin(5 * theta) + 30 * np.sin(23 * theta) + rng.normal(0, 0.5, n_points)
+
+    with open(path, 'w') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        f.write('<gpx version="1.1" creator="benchmark" xmlns="http://www.topografix.com/GPX/1/1">\n')
+        f.write(f' <trk>\n  <name>Synthetic {n_points} points</name>\n  <trkseg>\n')
+        f.writelines(f'   <trkpt lat="{lat:.7f}" lon="{lon:.7f}"><ele>{ele:.1f}</ele></trkpt>\n'
+                     for lat, lon, ele in zip(lats, lons, elevation))
+        f.write('  </trkseg>\n </trk>\n</gpx>\n')
+
+
+def run_case(gpx_path, loops, work_dir, track_memory=False, include_pdf=True):
+    """
+    Run the full analysis once and return its RunProfile
+
+    Args:
+        gpx_path (str): GPX file to analyze
+        loops (int): Number of loops
+        work_dir (str): Directory for the map HTML the app writes
+        track_memory (bool): Record peak memory per stage (slower)
+        include_pdf (bool): Include the PDF report stages
+
+    Returns:
+        RunProfile: Stage records plus an 'end_to_end' record
+    """
+    gc.collect()
+    profile = RunProfile('benchmark', track_memory=track_memory)
+    with profile:
+        with profile.stage('end_to_end') as frame:
+            analyzer = GPXAnalyzer(gpx_path, parser='stream')
+            analyzer.load_gpx()
+            analyzer.map_adjustment(loops=loops)
+            analyzer.calculate_distances()
+            analyzer.find_kilometer_markers()
+
+            pace_calc = PaceCalculator(analyzer, 6.2)
+            pace_calc.calculate_pace(decay=True, hill_mode=True)
+            pace_calc.calculate_times()
+            pace_calc.calculate_clock_times(datetime.time(6, 0))
+
+            map_viz = MapVisualizer(analyzer.final_df)
+            map_viz.create_base_map()
+            map_viz.add_kilometer_markers_directional()
+            map_viz.save_map(os.path.join(work_dir, 'route_map.html'))
+
+            if include_pdf:
+                km_data = analyzer.final_df[analyzer.final_df['is_km_marker'] == 1][
+                    ['km_number', 'total_distance', 'pace', 'grade', 'cumulative_time', 'clock_datetime']
+                ].copy()
+                km_data = add_time_strings(km_data, analyzer.race_start_datetime)
+                km_data['Notes'] = ''
+                generate_gpx_analysis_pdf(
+                    analyzer=analyzer,
+                    km_data=km_data,
+                    total_distance=analyzer.final_df['total_distance'].max(),
+                    pace_minutes=6,
+                    pace_seconds=12,
+                    finish_time=km_data['cumulative_time_hms'].iloc[-1],
+                    total_elevation_gain=analyzer.uphill * loops,
+                    route_name=os.path.basename(gpx_path)
+                )
+            frame['points'] = len(analyzer.final_df)
+    return profile
+
+
+def summarize(profiles):
+    """Median wall time per stage over repeated runs, with throughput in points/sec"""
+    stages = {}
+    for profile in profiles:
+        for record in profile.records:
+            stages.setdefault(record['stage'], []).append(record)
+
+    summary = {}
+    for stage, records in stages.items():
+        wall_ms = float(np.median([r['wall_ms'] for r in records]))
+        points = records[-1]['points']
+        peaks = [r['peak_memory_mb'] for r in records if r['peak_memory_mb'] is not None]
+        summary[stage] = {
+            'wall_ms': round(wall_ms, 3),
+            'points': points,
+            'points_per_sec': round(points / (wall_ms / 1000), 1) if points and wall_ms > 0 else None,
+            'peak_memory_mb': max(peaks) if peaks else None,
+        }
+    return summary
+
+
+def build_cases(args, work_dir):
+    cases = []
+    if args.saved_routes and os.path.isdir(SAVED_ROUTES_DIR):
+        for file_name in sorted(os.listdir(SAVED_ROUTES_DIR), key=str.lower):
+            if file_name.endswith('.gpx'):
+                for loops in args.loops:
+                    cases.append((f"{file_name} x{loops}", os.path.join(SAVED_ROUTES_DIR, file_name), loops))
+
+    for n_points in args.sizes:
+        path = os.path.join(work_dir, f"synthetic_{n_points}.gpx")
+        write_synthetic_gpx(path, n_points, seed=args.seed)
+        for loops in args.loops:
+            cases.append((f"synthetic_{n_points} x{loops}", path, loops))
+    return cases
+
+
+def compare(results, baseline, tolerance):
+    """Print stage by stage ratios against the baseline and return the regressions"""
+    regressions = []
+    print(f"\n{'case':<40} {'stage':<45} {'baseline ms':>12} {'current ms':>12} {'ratio':>7}")
+    for case, stages in results.items():
+        base_stages = baseline.get('results', {}).get(case)
+        if base_stages is None:
+            continue
+        for stage, current in stages.items():
+            base = base_stages.get(stage)
+            if base is None or not base['wall_ms']:
+                continue
+            ratio = current['wall_ms'] / base['wall_ms']
+            flag = ''
+            if ratio > 1 + tolerance:
+                flag = '  REGRESSION'
+                regressions.append((case, stage, ratio))
+            print(f"{case:<40} {stage:<45} {base['wall_ms']:>12.1f} {current['wall_ms']:>12.1f} {ratio:>7.2f}{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the GPX Pace Planner pipeline")
+    parser.add_argument('--sizes', type=int, nargs='*', default=DEFAULT_SIZES, help="Synthetic track point counts")
+    parser.add_argument('--loops', type=int, nargs='*', default=DEFAULT_LOOPS, help="Loop counts to run every route with")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per case, the median is reported")
+    parser.add_argument('--no-saved-routes', dest='saved_routes', action='store_false', help="Skip saved_routes/")
+    parser.add_argument('--no-pdf', dest='include_pdf', action='store_false', help="Skip the PDF report stages")
+    parser.add_argument('--memory', action='store_true', help="Record peak memory per stage (slower)")
+    parser.add_argument('--seed', type=int, default=0, help="Seed for synthetic tracks")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="Baseline JSON to compare against / save to")
+    parser.add_argument('--save-baseline', action='store_true', help="Write the results as the new baseline")
+    parser.add_argument('--output', help="Also write the results JSON here")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="Allowed slowdown ratio above 1 before failing")
+    args = parser.parse_args(argv)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as work_dir:
+        for case, path, loops in build_cases(args, work_dir):
+            start = time.perf_counter()
+            profiles = [run_case(path, loops, work_dir, track_memory=args.memory, include_pdf=args.include_pdf)
+                        for _ in range(args.repeat)]
+            results[case] = summarize(profiles)
+            end_to_end = results[case]['end_to_end']
+            print(f"{case:<40} {end_to_end['points']:>10} points  {end_to_end['wall_ms']:>10.1f} ms  "
+                  f"{end_to_end['points_per_sec'] or 0:>12.0f} points/s  ({time.perf_counter() - start:.1f}s total)")
+
+    report = {
+        'created_at': datetime.datetime.now().isoformat(timespec='seconds'),
+        'machine': {'python': platform.python_version(), 'platform': platform.platform(),
+                    'processor': platform.processor()},
+        'settings': {'repeat': args.repeat, 'memory': args.memory, 'include_pdf': args.include_pdf},
+        'results': results,
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nBaseline written to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"\nNo baseline at {args.baseline}, run with --save-baseline to create one")
+        return 0
+
+    with open(args.baseline, 'r') as f:
+        baseline = json.load(f)
+    if baseline.get('settings') != report['settings']:
+        print(f"\nWarning: baseline was recorded with {baseline.get('settings')}, this run used {report['settings']}")
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print(f"\n{len(regressions)} stage(s) slower than baseline by more than {args.tolerance:.0%}")
+        return 1
+    print("\nNo regressions against baseline")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -12,7 +12,11 @@ import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.patches as patches
 from matplotlib.collections import LineCollection
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 import plotly.express as px
+from pace_planner import add_time_strings, nearest_indices
+from profiling import instrumented
 import tempfile
 import os
 
@@ -33,24 +37,70 @@ def convert_to_km(miles):
     """Convert miles to kilometers"""
     return miles * 1.60934
 
+def parse_duration(duration_str):
+    """
+    Parse a duration typed as HH:MM:SS or HH:MM into minutes (hours may exceed 24)
+
+    Args:
+        duration_str (str): Duration text, e.g. '4:30:00'
+
+    Returns:
+        float: Duration in minutes
+    """
+    parts = str(duration_str).strip().split(':')
+    try:
+        if len(parts) not in (2, 3):
+            raise ValueError
+        hours, minutes = int(parts[0]), int(parts[1])
+        seconds = float(parts[2]) if len(parts) == 3 else 0.0
+    except ValueError:
+        raise ValueError(f"Invalid duration '{duration_str}', expected HH:MM:SS")
+    if hours < 0 or not 0 <= minutes < 60 or not 0 <= seconds < 60:
+        raise ValueError(f"Invalid duration '{duration_str}', expected HH:MM:SS")
+    return hours * 60 + minutes + seconds / 60
+
+def parse_pace(pace_str):
+    """
+    Parse a pace typed as M:SS into minutes
+
+    Args:
+        pace_str (str): Pace text, e.g. '5:45'
+
+    Returns:
+        float: Pace in minutes per unit distance
+    """
+    parts = str(pace_str).strip().split(':')
+    try:
+        if len(parts) != 2:
+            raise ValueError
+        minutes, seconds = int(parts[0]), float(parts[1])
+    except ValueError:
+        raise ValueError(f"Invalid pace '{pace_str}', expected M:SS")
+    if minutes < 0 or not 0 <= seconds < 60 or minutes + seconds == 0:
+        raise ValueError(f"Invalid pace '{pace_str}', expected M:SS")
+    return minutes + seconds / 60
+
 def calculate_time_difference(row):
     """
     Calculate the difference between cutoff time and clock time in minutes.
     
     Args:
-        row: DataFrame row containing 'cutoff_time_formatted' and 'clock_time' columns
+        row: DataFrame row containing 'cutoff_time_formatted' and 'clock_datetime' (or 'clock_time') columns
     
     Returns:
         float: Difference in minutes (positive = arrive before cutoff, negative = arrive after cutoff)
         pd.NA: If either time is missing or invalid
     """
-    if pd.notna(row['cutoff_time_formatted']) and pd.notna(row['clock_time']):
+    clock_value = row['clock_datetime'] if 'clock_datetime' in row else row.get('clock_time', pd.NA)
+    if pd.notna(row['cutoff_time_formatted']) and pd.notna(clock_value):
         try:
             # Parse clock_time string to time object if it's a string
-            if isinstance(row['clock_time'], str):
-                clock_time = datetime.datetime.strptime(row['clock_time'], "%H:%M:%S").time()
+            if isinstance(clock_value, str):
+                clock_time = datetime.datetime.strptime(clock_value, "%H:%M:%S").time()
+            elif isinstance(clock_value, datetime.datetime):
+                clock_time = clock_value.time()
             else:
-                clock_time = row['clock_time']
+                clock_time = clock_value
             
             cutoff_time = row['cutoff_time_formatted']
             
@@ -66,36 +116,163 @@ def calculate_time_difference(row):
             return pd.NA
     return pd.NA
 
-def create_static_map_image(analyzer_df, show_arrows=True, width_inches=8, height_inches=6):
+def _cutoff_schedule(analyzer_final_df, race_start_datetime):
+    """cutoff_deadlines plus a flag per cutoff that comes before the one preceding it"""
+    empty = np.array([], dtype=int), np.array([], dtype=float), np.array([], dtype=bool)
+    if 'cutoff_time_formatted' not in analyzer_final_df.columns or race_start_datetime is None:
+        return empty
+
+    cutoffs = analyzer_final_df['cutoff_time_formatted']
+    rows = np.flatnonzero(cutoffs.notna().to_numpy())
+    if len(rows) == 0:
+        return empty
+
+    # seconds since midnight of the start day, only for the marker rows
+    cutoff_seconds = [t.hour * 3600 + t.minute * 60 + t.second for t in cutoffs.to_numpy()[rows]]
+    start = pd.Timestamp(race_start_datetime)
+    start_seconds = start.hour * 3600 + start.minute * 60 + start.second
+    planned_finish = start_seconds
+    if 'cumulative_time' in analyzer_final_df.columns and len(analyzer_final_df):
+        planned_finish += float(analyzer_final_df['cumulative_time'].max()) * 60
+
+    deadlines = np.empty(len(rows))
+    out_of_order = np.zeros(len(rows), dtype=bool)
+    latest = start_seconds
+    for i, clock in enumerate(cutoff_seconds):
+        day = latest // 86400 * 86400
+        deadline = day + clock
+        if i == 0 and deadline <= start_seconds:
+            # a cutoff at or before the start time is on the next day
+            deadline += 86400
+        elif deadline < latest:
+            if planned_finish >= day + 86400:
+                # the race runs past midnight, so an earlier clock time is on the next day
+                deadline += 86400
+            else:
+                out_of_order[i] = True
+        deadlines[i] = deadline - start_seconds
+        latest = max(latest, deadline)
+    return rows, deadlines / 60, out_of_order
+
+def cutoff_deadlines(analyzer_final_df, race_start_datetime):
+    """
+    Elapsed race time by which each cutoff marker has to be reached.
+    Cutoffs are clock times on the start day. The first cutoff moves to the next day when it
+    is at or before the start time, a later one when it is earlier than the cutoff before it
+    and the planned race runs past midnight, so cutoffs on day 2 and later of a multi-day
+    event land on the right day. Equal clock times stay on the same day, and an earlier
+    clock time on a race that ends the same day is kept as is (see calculate_cutoff_buffers).
+
+    Args:
+        analyzer_final_df: DataFrame with cutoff_time_formatted on the cutoff marker rows
+            and cumulative_time for the planned finish
+        race_start_datetime: Race start as a datetime/Timestamp
+
+    Returns:
+        tuple: (row positions of the cutoff markers, deadline in elapsed minutes per marker)
+    """
+    rows, deadlines, _ = _cutoff_schedule(analyzer_final_df, race_start_datetime)
+    return rows, deadlines
+
+def calculate_cutoff_buffers(analyzer_final_df, race_start_datetime):
+    """
+    Write cutoff_buffer_minutes: minutes between the planned arrival and the cutoff on every
+    cutoff marker row (positive = arrive before the cutoff), NaN on all other rows, and
+    cutoff_out_of_order: True on cutoff rows whose time is earlier than a cutoff before them
+    on a race that does not run past midnight, which is most likely a typo
+
+    Args:
+        analyzer_final_df: DataFrame with cumulative_time and cutoff_time_formatted
+        race_start_datetime: Race start as a datetime/Timestamp
+
+    Returns:
+        DataFrame: analyzer_final_df with the columns written in place
+    """
+    rows, deadlines, out_of_order = _cutoff_schedule(analyzer_final_df, race_start_datetime)
+    buffer = np.full(len(analyzer_final_df), np.nan)
+    buffer[rows] = np.round(deadlines - analyzer_final_df['cumulative_time'].to_numpy(dtype=float)[rows], 1)
+    analyzer_final_df['cutoff_buffer_minutes'] = buffer
+    flags = np.zeros(len(analyzer_final_df), dtype=bool)
+    flags[rows] = out_of_order
+    analyzer_final_df['cutoff_out_of_order'] = flags
+    return analyzer_final_df
+
+# Color bands in the static route image, enough for a smooth looking gradient
+GRADIENT_STEPS = 64
+
+def pixel_decimate(x, y, bounds, width_px, height_px):
     """
-    Create a stylized PNG map image using matplotlib without axes or grid
+    Drop points that land in the same output pixel as the point before them, so a
+    polyline never has more vertices than it can show at the target resolution
+
+    Args:
+        x, y (np.ndarray): Point coordinates
+        bounds (tuple): (x_min, x_max, y_min, y_max) mapped onto the image
+        width_px, height_px (int): Image size in pixels
+
+    Returns:
+        np.ndarray: Positions of the kept points, always including the first and last
+    """
+    if len(x) < 3:
+        return np.arange(len(x))
+    x_min, x_max, y_min, y_max = bounds
+    px = np.floor((x - x_min) / max(x_max - x_min, 1e-12) * width_px).astype(np.int64)
+    py = np.floor((y - y_min) / max(y_max - y_min, 1e-12) * height_px).astype(np.int64)
+    pixel = px * (height_px + 1) + py
+    keep = np.empty(len(x), dtype=bool)
+    keep[0] = True
+    keep[1:] = pixel[1:] != pixel[:-1]
+    keep[-1] = True
+    return np.flatnonzero(keep)
+
+@instrumented(points=lambda analyzer_df, *args, **kwargs: len(analyzer_df))
+def create_static_map_image(analyzer_df, show_arrows=True, width_inches=8, height_inches=6, dpi=120):
+    """
+    Create a stylized PNG map image using matplotlib without axes or grid.
+    The route is decimated to the image's pixel grid first, so render time depends
+    on the image size rather than the number of trackpoints.
     
     Args:
         analyzer_df: DataFrame from GPXAnalyzer with route data
         show_arrows: Boolean to show directional arrows or simple markers (currently uses circles)
-        width_inches: Width of the image in inches
-        height_inches: Height of the image in inches
+        width_inches: Maximum width of the image in inches
+        height_inches: Maximum height of the image in inches
+        dpi: Output resolution
     
     Returns:
-        BytesIO: PNG image data as bytes
+        BytesIO: PNG image data as bytes, cropped to the route's aspect ratio
     """
-    fig, ax = plt.subplots(figsize=(width_inches, height_inches), dpi=150, facecolor='white')
-    
     # Get the route coordinates
-    lats = analyzer_df['latitude'].values
-    lons = analyzer_df['longitude'].values
-    
-    # Create a gradient effect along the route
-    points = np.array([lons, lats]).T.reshape(-1, 1, 2)
-    segments = np.concatenate([points[:-1], points[1:]], axis=1)
+    lats = analyzer_df['latitude'].to_numpy(dtype=float)
+    lons = analyzer_df['longitude'].to_numpy(dtype=float)
     
-    # Create colors that transition from blue to red along the route
-    n_segments = len(segments)
-    colors_gradient = plt.cm.viridis(np.linspace(0, 1, n_segments))
-    
-    # Create line collection with gradient colors
-    lc = LineCollection(segments, colors=colors_gradient, linewidths=4, alpha=0.8)
-    line = ax.add_collection(lc)
+    # Calculate bounds with minimal padding for a cleaner look
+    lat_range = lats.max() - lats.min()
+    lon_range = lons.max() - lons.min()
+    padding = max(lat_range, lon_range) * 0.05 or 1e-4
+    bounds = (lons.min() - padding, lons.max() + padding, lats.min() - padding, lats.max() + padding)
+
+    # Equal aspect figure fitted inside width x height, no tight bbox pass needed
+    span_x, span_y = bounds[1] - bounds[0], bounds[3] - bounds[2]
+    scale = min(width_inches / span_x, height_inches / span_y)
+    fig_width, fig_height = span_x * scale, span_y * scale
+    fig = Figure(figsize=(fig_width, fig_height), dpi=dpi, facecolor='white')
+    FigureCanvasAgg(fig)
+    ax = fig.add_axes([0, 0, 1, 1])
+    ax.set_axis_off()
+    ax.set_xlim(bounds[0], bounds[1])
+    ax.set_ylim(bounds[2], bounds[3])
+
+    # Gradient effect along the route: the decimated line is drawn in GRADIENT_STEPS
+    # bands colored by their position along the full route, not one path per segment
+    keep = pixel_decimate(lons, lats, bounds, int(fig_width * dpi), int(fig_height * dpi))
+    points = np.column_stack((lons[keep], lats[keep]))
+    if len(points) > 1:
+        bands = np.array_split(np.arange(len(points) - 1), min(GRADIENT_STEPS, len(points) - 1))
+        lines = [points[band[0]:band[-1] + 2] for band in bands]
+        progress = np.array([keep[band[len(band) // 2]] for band in bands]) / max(len(lons) - 1, 1)
+        lc = LineCollection(lines, colors=plt.cm.viridis(progress), linewidths=4, alpha=0.8)
+        ax.add_collection(lc)
     
     # Add start marker (green circle)
     ax.scatter(lons[0], lats[0], c='#2ECC71', s=200, marker='o', 
@@ -106,36 +283,10 @@ def create_static_map_image(analyzer_df, show_arrows=True, width_inches=8, heigh
         ax.scatter(lons[-1], lats[-1], c='#E74C3C', s=200, marker='s', 
                   zorder=6, edgecolor='white', linewidth=3, alpha=0.9)
     
-    # Set equal aspect ratio and adjust bounds
-    ax.set_aspect('equal')
-    
-    # Calculate bounds with minimal padding for a cleaner look
-    lat_range = max(lats) - min(lats)
-    lon_range = max(lons) - min(lons)
-    padding = max(lat_range, lon_range) * 0.05  # Reduced padding
-    
-    ax.set_xlim(min(lons) - padding, max(lons) + padding)
-    ax.set_ylim(min(lats) - padding, max(lats) + padding)
-    
-    # Remove all axes, labels, ticks, and spines for a clean look
-    ax.set_xticks([])
-    ax.set_yticks([])
-    ax.spines['top'].set_visible(False)
-    ax.spines['right'].set_visible(False)
-    ax.spines['bottom'].set_visible(False)
-    ax.spines['left'].set_visible(False)
-    
-    # Set background color
-    ax.set_facecolor('white')
-    
-    # Remove any margins
-    plt.subplots_adjust(left=0, right=1, top=1, bottom=0)
-    
-    # Save to BytesIO
+    # Save to BytesIO, a standalone Figure keeps this safe off the script thread
     img_buffer = BytesIO()
-    plt.savefig(img_buffer, format='png', dpi=120, bbox_inches='tight', facecolor='white')
+    fig.savefig(img_buffer, format='png', dpi=dpi, facecolor='white')
     img_buffer.seek(0)
-    plt.close(fig)  # Clean up the figure
     
     return img_buffer
 
@@ -168,8 +319,9 @@ def dynamic_input_data_editor(data, key, **_kwargs):
     __kwargs.update({'data': data, 'key': key, 'on_change': on_data_editor_changed})
     return st.data_editor(**__kwargs)
 
+@instrumented(points=lambda analyzer, *args, **kwargs: len(analyzer.final_df))
 def generate_gpx_analysis_pdf(analyzer, km_data, total_distance, pace_minutes, pace_seconds, finish_time, 
-                             total_elevation_gain, use_metric=True, route_name="GPX Route"):
+                             total_elevation_gain, use_metric=True, route_name="GPX Route", map_image=None):
     """
     Generate a PDF report of the GPX analysis results.
     
@@ -182,6 +334,7 @@ def generate_gpx_analysis_pdf(analyzer, km_data, total_distance, pace_minutes, p
         total_elevation_gain: Total elevation gain
         use_metric: Boolean for metric vs imperial units
         route_name: Name of the route for the report title
+        map_image: PNG bytes of the route map, rendered with create_static_map_image when None
     
     Returns:
         BytesIO object containing the PDF data
@@ -239,8 +392,11 @@ def generate_gpx_analysis_pdf(analyzer, km_data, total_distance, pace_minutes, p
     
     # Add Route Map right after title
     try:
-        # Generate the stylized map image using matplotlib
-        map_img_buffer = create_static_map_image(analyzer.final_df, show_arrows=True, width_inches=6, height_inches=3)
+        # Generate the stylized map image using matplotlib, unless the caller already has it
+        if map_image is not None:
+            map_img_buffer = BytesIO(map_image)
+        else:
+            map_img_buffer = create_static_map_image(analyzer.final_df, show_arrows=True, width_inches=6, height_inches=3)
         
         # Create Image directly from BytesIO buffer (no temporary file needed)
         map_img_buffer.seek(0)  # Reset buffer position
@@ -448,15 +604,38 @@ def generate_gpx_analysis_pdf(analyzer, km_data, total_distance, pace_minutes, p
     buffer.seek(0)
     return buffer
 
-def merge_custom_markers(analyzer_final_df, custom_marker_data, use_km_markers=True):
+def parse_cutoff_times(cutoff_times):
+    """
+    Parse cutoff times typed as HH:MM:SS or HH:MM, all at once
+
+    Args:
+        cutoff_times: Series of cutoff entries (strings, times or missing)
+
+    Returns:
+        Series: datetime.time per entry, pd.NA where missing or unparseable
+    """
+    text = cutoff_times.where(cutoff_times.notna(), '').astype(str).str.strip()
+    parsed = pd.to_datetime(text, format="%H:%M:%S", errors='coerce')
+    parsed = parsed.fillna(pd.to_datetime(text, format="%H:%M", errors='coerce'))
+    return pd.Series([t.time() if pd.notna(t) else pd.NA for t in parsed], index=cutoff_times.index, dtype=object)
+
+def merge_custom_markers(analyzer_final_df, custom_marker_data, use_km_markers=True, exact_placement=False,
+                         include_start=False):
     """
     Merge custom markers (like aid stations) with the analyzer's final DataFrame
     based on the nearest kilometer marker.
+
+    All markers are placed with one binary search over the sorted distances, markers that
+    land on the same row are joined with ', ' in input order and the last one's cutoff is kept.
     
     Args:
         analyzer_final_df: DataFrame from GPXAnalyzer.final_df
-        custom_marker_data: DataFrame with columns ['Distance', 'Nickname']
+        custom_marker_data: DataFrame with columns ['Distance', 'Nickname'] and optionally 'Cutoff Time'
         use_km_markers: Boolean indicating if distances are in km (True) or miles (False)
+        exact_placement: Place each marker on the route point closest to its distance
+            instead of snapping it to the nearest kilometer marker
+        include_start: Keep markers at distance 0 (e.g. waypoints snapped to the start line),
+            otherwise only distances > 0 are placed
     
     Returns:
         DataFrame: Updated final_df with custom marker information merged
@@ -476,87 +655,57 @@ def merge_custom_markers(analyzer_final_df, custom_marker_data, use_km_markers=T
         return df
     
     # Clean and validate custom marker data
-    custom_markers = custom_marker_data.copy()
-    
-    # Remove rows with missing or invalid data
-    custom_markers = custom_markers.dropna(subset=['Distance', 'Nickname'])
+    custom_markers = custom_marker_data.dropna(subset=['Distance', 'Nickname']).copy()
     custom_markers['Distance'] = pd.to_numeric(custom_markers['Distance'], errors='coerce')
-    custom_markers = custom_markers[custom_markers['Distance'] > 0]
-    custom_markers = custom_markers[custom_markers['Nickname'].str.strip() != '']
+    custom_markers['Nickname'] = custom_markers['Nickname'].astype(str).str.strip()
+    on_route = custom_markers['Distance'] >= 0 if include_start else custom_markers['Distance'] > 0
+    custom_markers = custom_markers[on_route & (custom_markers['Nickname'] != '')]
     
     if len(custom_markers) == 0:
         return df
-    
-    #try to interpret cutoff times from custom markers
-    if not custom_markers.empty and len(custom_markers) > 0:
-        # Check if 'Cutoff Time' column exists and has valid entries
-        if 'Cutoff Time' in custom_markers.columns:
-            # Initialize cutoff_time_formatted column if it doesn't exist
-            if 'cutoff_time_formatted' not in custom_markers.columns:
-                custom_markers['cutoff_time_formatted'] = pd.NA
-                
-            for idx, row in custom_markers.iterrows():
-                cutoff_time_str = row.get('Cutoff Time', None)
-                if pd.notna(cutoff_time_str) and str(cutoff_time_str).strip() != '':
-                    try:
-                        cutoff_str = str(cutoff_time_str).strip()
-                        # Try parsing with seconds first (HH:MM:SS)
-                        try:
-                            custom_markers.at[idx, 'cutoff_time_formatted'] = datetime.datetime.strptime(cutoff_str, "%H:%M:%S").time()
-                        except ValueError:
-                            # If that fails, try parsing without seconds (HH:MM)
-                            custom_markers.at[idx, 'cutoff_time_formatted'] = datetime.datetime.strptime(cutoff_str, "%H:%M").time()
-                    except ValueError:
-                        # Fill with NA value instead of showing warning to avoid breaking computation
-                        custom_markers.at[idx, 'cutoff_time_formatted'] = pd.NA
 
+    has_cutoffs = 'Cutoff Time' in custom_markers.columns
+    if has_cutoffs:
+        custom_markers['cutoff_time_formatted'] = parse_cutoff_times(custom_markers['Cutoff Time'])
 
     # Convert distances to km if they're in miles
     if not use_km_markers:
-        custom_markers['Distance'] = custom_markers['Distance'].apply(convert_to_km)
+        custom_markers['Distance'] = convert_to_km(custom_markers['Distance'])
     
-    # Get only kilometer marker rows for matching
-    km_markers = df[df['is_km_marker'] == 1].copy()
+    # Rows a marker can be placed on: every point, or only the kilometer markers
+    if exact_placement:
+        candidate_rows = np.arange(len(df))
+    else:
+        candidate_rows = np.flatnonzero(df['is_km_marker'].to_numpy() == 1)
     
-    if len(km_markers) == 0:
+    if len(candidate_rows) == 0:
         return df
     
     # Initialize cutoff_time_formatted column in main df if cutoff times exist in input
-    if 'Cutoff Time' in custom_marker_data.columns:
-        if 'cutoff_time_formatted' not in df.columns:
-            df['cutoff_time_formatted'] = pd.NA
-
-    # For each custom marker, find the nearest kilometer marker
-    for _, marker in custom_markers.iterrows():
-        target_distance = marker['Distance']
-        nickname = marker['Nickname'].strip()
-        cutoff_time = marker.get('cutoff_time_formatted', pd.NA) if 'cutoff_time_formatted' in marker else pd.NA
-        
-        # Find the closest km marker by total_distance
-        distances = np.abs(km_markers['total_distance'] - target_distance)
-        closest_idx = distances.idxmin()
-        
-        # Get the km_number of the closest marker
-        closest_km = km_markers.loc[closest_idx, 'km_number']
-        
-        # Update all rows with this km_number to include the custom marker
-        mask = (df['km_number'] == closest_km) & (df['is_km_marker'] == 1)
-        
-        if mask.any():
-            # If there's already a custom marker, append with separator
-            existing_marker = df.loc[mask, 'custom_marker'].iloc[0]
-            existing_nickname = df.loc[mask, 'marker_nickname'].iloc[0]
-            
-            if existing_marker and existing_marker.strip():
-                df.loc[mask, 'custom_marker'] = f"{existing_marker}, {nickname}"
-                df.loc[mask, 'marker_nickname'] = f"{existing_nickname}, {nickname}"
-            else:
-                df.loc[mask, 'custom_marker'] = nickname
-                df.loc[mask, 'marker_nickname'] = nickname
-            
-            # Add cutoff time if column is available (even if cutoff_time is NA)
-            if 'cutoff_time_formatted' in df.columns:
-                df.loc[mask, 'cutoff_time_formatted'] = cutoff_time
+    if has_cutoffs and 'cutoff_time_formatted' not in df.columns:
+        df['cutoff_time_formatted'] = pd.NA
+
+    # Nearest candidate row for every marker (ties go to the earlier row, like idxmin)
+    candidate_distance = df['total_distance'].to_numpy(dtype=float)[candidate_rows]
+    custom_markers['row'] = candidate_rows[nearest_indices(candidate_distance, custom_markers['Distance'].to_numpy())]
+
+    # One entry per target row, names joined in input order
+    placed = custom_markers.groupby('row', sort=False)['Nickname'].agg(', '.join)
+    rows = placed.index.to_numpy()
+    col_marker = df.columns.get_loc('custom_marker')
+    col_nickname = df.columns.get_loc('marker_nickname')
+
+    # If there's already a custom marker, append with separator
+    for col in (col_marker, col_nickname):
+        existing = df.iloc[rows, col].fillna('').astype(str)
+        has_existing = existing.str.strip().ne('').to_numpy()
+        df.iloc[rows, col] = np.where(has_existing, existing.to_numpy() + ', ' + placed.to_numpy(), placed.to_numpy())
+
+    # Add cutoff time if column is available (even if cutoff_time is NA), the last marker on a row wins
+    if 'cutoff_time_formatted' in df.columns:
+        last_cutoff = custom_markers.drop_duplicates('row', keep='last')
+        cutoff_values = last_cutoff['cutoff_time_formatted'] if has_cutoffs else pd.Series(pd.NA, index=last_cutoff.index)
+        df.iloc[last_cutoff['row'].to_numpy(), df.columns.get_loc('cutoff_time_formatted')] = cutoff_values.to_numpy()
     
     return df
 
@@ -571,19 +720,18 @@ def get_custom_markers_summary(analyzer_final_df):
         DataFrame: Summary of custom markers with their positions and details
     """
     
-    # Filter for km markers that have custom markers
+    # Filter for rows that have custom markers
     custom_marker_rows = analyzer_final_df[
-        (analyzer_final_df['is_km_marker'] == 1) & 
-        (analyzer_final_df['custom_marker'].str.strip() != '')
+        analyzer_final_df['custom_marker'].str.strip() != ''
     ].copy()
     
     if len(custom_marker_rows) == 0:
         return pd.DataFrame(columns=['KM', 'Distance', 'Marker', 'Pace', 'Time'])
     
     # Create summary DataFrame
-    summary = custom_marker_rows[[
-        'km_number', 'total_distance', 'custom_marker', 'pace', 'cumulative_time_hms'
-    ]].copy()
+    summary = add_time_strings(custom_marker_rows[[
+        'km_number', 'total_distance', 'custom_marker', 'pace', 'cumulative_time'
+    ]].copy()).drop(columns='cumulative_time')
     
     summary.columns = ['KM', 'Distance', 'Marker', 'Pace', 'Time']
     summary = summary.reset_index(drop=True)
@@ -1,6 +1,9 @@
 #Map package
+import io
+import os
 import datetime
 import gpxpy
+from xml.parsers import expat
 from geopy.distance import geodesic
 
 #Data wrangling
@@ -10,8 +13,12 @@ import math
 
 #visualization
 import folium
+from folium.utilities import JsCode
 import matplotlib.pyplot as plt
 
+#instrumentation hooks, no-ops unless a profiling.RunProfile is active
+from profiling import instrumented
+
 
 #Usage Order IMPORTANT
 # analyzer = GPXAnalyzer('route.gpx')
@@ -27,6 +34,145 @@ import matplotlib.pyplot as plt
 # map.create_base_map()
 # map.add_kilometer_markers()
 # map.save('my_map.html')
+
+# WGS-84 ellipsoid, the same model geopy's geodesic uses by default
+WGS84_A = 6378.137  # semi-major axis (km)
+WGS84_F = 1 / 298.257223563  # flattening
+WGS84_B = WGS84_A * (1 - WGS84_F)  # semi-minor axis (km)
+EARTH_MEAN_RADIUS = 6371.0088  # mean earth radius (km) used for haversine
+
+DISTANCE_METHODS = ('ellipsoidal', 'haversine', 'geodesic')
+
+def haversine_distances(lat1, lon1, lat2, lon2):
+    """
+    Great-circle distance between arrays of points on a spherical earth.
+    Fastest option, but can be off from geodesic by up to ~0.5% because the
+    earth is not a sphere.
+
+    Args:
+        lat1, lon1, lat2, lon2 (array-like): Coordinates in degrees
+
+    Returns:
+        np.ndarray: Distances in km
+    """
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_MEAN_RADIUS * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+def initial_bearings(lat1, lon1, lat2, lon2):
+    """
+    Initial great-circle bearing from point 1 to point 2 for arrays of points
+
+    Args:
+        lat1, lon1, lat2, lon2 (array-like): Coordinates in degrees
+
+    Returns:
+        np.ndarray: Bearings in degrees (0-360)
+    """
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    dlon = lon2 - lon1
+    y = np.sin(dlon) * np.cos(lat2)
+    x = np.cos(lat1) * np.sin(lat2) - np.sin(lat1) * np.cos(lat2) * np.cos(dlon)
+    return (np.degrees(np.arctan2(y, x)) + 360) % 360
+
+def vincenty_distances(lat1, lon1, lat2, lon2, tolerance=1e-12, max_iterations=200):
+    """
+    Vectorized Vincenty inverse solution on the WGS-84 ellipsoid.
+    For GPS track segments this stays within 1 mm of geopy's geodesic
+    (Vincenty's own accuracy bound is 0.5 mm). The rare nearly-antipodal
+    pairs that fail to converge fall back to geopy's geodesic.
+
+    Args:
+        lat1, lon1, lat2, lon2 (array-like): Coordinates in degrees
+        tolerance (float): Convergence threshold on lambda in radians
+        max_iterations (int): Iteration limit before falling back to geodesic
+
+    Returns:
+        np.ndarray: Distances in km
+    """
+    lat1, lon1, lat2, lon2 = (np.asarray(x, dtype=float) for x in (lat1, lon1, lat2, lon2))
+    f = WGS84_F
+
+    U1 = np.arctan((1 - f) * np.tan(np.radians(lat1)))
+    U2 = np.arctan((1 - f) * np.tan(np.radians(lat2)))
+    sin_U1, cos_U1 = np.sin(U1), np.cos(U1)
+    sin_U2, cos_U2 = np.sin(U2), np.cos(U2)
+    L = np.radians(lon2 - lon1)
+
+    lam = L.copy()
+    converged = np.zeros(L.shape, dtype=bool)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for _ in range(max_iterations):
+            sin_lam, cos_lam = np.sin(lam), np.cos(lam)
+            sin_sigma = np.sqrt((cos_U2 * sin_lam) ** 2 +
+                                (cos_U1 * sin_U2 - sin_U1 * cos_U2 * cos_lam) ** 2)
+            cos_sigma = sin_U1 * sin_U2 + cos_U1 * cos_U2 * cos_lam
+            sigma = np.arctan2(sin_sigma, cos_sigma)
+
+            # coincident points have sin_sigma == 0
+            sin_alpha = np.where(sin_sigma == 0, 0.0, cos_U1 * cos_U2 * sin_lam / sin_sigma)
+            cos_sq_alpha = 1 - sin_alpha ** 2
+            # equatorial lines have cos_sq_alpha == 0
+            cos_2sigma_m = np.where(cos_sq_alpha == 0, 0.0, cos_sigma - 2 * sin_U1 * sin_U2 / cos_sq_alpha)
+
+            C = f / 16 * cos_sq_alpha * (4 + f * (4 - 3 * cos_sq_alpha))
+            lam_prev = lam
+            lam = L + (1 - C) * f * sin_alpha * (
+                sigma + C * sin_sigma * (cos_2sigma_m + C * cos_sigma * (-1 + 2 * cos_2sigma_m ** 2)))
+
+            converged = np.abs(lam - lam_prev) < tolerance
+            if converged.all():
+                break
+
+        u_sq = cos_sq_alpha * (WGS84_A ** 2 - WGS84_B ** 2) / WGS84_B ** 2
+        A = 1 + u_sq / 16384 * (4096 + u_sq * (-768 + u_sq * (320 - 175 * u_sq)))
+        B = u_sq / 1024 * (256 + u_sq * (-128 + u_sq * (74 - 47 * u_sq)))
+        delta_sigma = B * sin_sigma * (cos_2sigma_m + B / 4 * (
+            cos_sigma * (-1 + 2 * cos_2sigma_m ** 2) -
+            B / 6 * cos_2sigma_m * (-3 + 4 * sin_sigma ** 2) * (-3 + 4 * cos_2sigma_m ** 2)))
+        distances = WGS84_B * A * (sigma - delta_sigma)
+
+    # Fall back to geopy for anything that did not converge
+    for i in np.flatnonzero(~converged & np.isfinite(lat1) & np.isfinite(lat2)):
+        distances[i] = geodesic((lat1[i], lon1[i]), (lat2[i], lon2[i])).kilometers
+
+    return distances
+
+def segment_distances(latitudes, longitudes, method: str = 'ellipsoidal'):
+    """
+    Distance from each trackpoint to the one before it, computed in one pass.
+
+    Args:
+        latitudes (array-like): Latitudes in degrees
+        longitudes (array-like): Longitudes in degrees
+        method (str): 'ellipsoidal' (vectorized Vincenty, within 1 mm of geodesic),
+            'haversine' (spherical, within ~0.5% of geodesic) or
+            'geodesic' (per-point geopy reference, slowest)
+
+    Returns:
+        np.ndarray: Segment distances in km, 0 for the first point and for
+            any point next to a missing coordinate
+    """
+    lats = np.asarray(latitudes, dtype=float)
+    lons = np.asarray(longitudes, dtype=float)
+    distances = np.zeros(len(lats))
+    if len(lats) < 2:
+        return distances
+
+    if method == 'ellipsoidal':
+        distances[1:] = vincenty_distances(lats[:-1], lons[:-1], lats[1:], lons[1:])
+    elif method == 'haversine':
+        distances[1:] = haversine_distances(lats[:-1], lons[:-1], lats[1:], lons[1:])
+    elif method == 'geodesic':
+        for i in range(1, len(lats)):
+            prev, curr = (lats[i - 1], lons[i - 1]), (lats[i], lons[i])
+            if not (np.isnan(prev[0]) or np.isnan(curr[0])):
+                distances[i] = geodesic(prev, curr).kilometers
+    else:
+        raise ValueError(f"Unknown distance method '{method}', expected one of {DISTANCE_METHODS}")
+
+    return np.nan_to_num(distances, nan=0.0)
+
 def speed_calculation(base_pace, current_distance, grade, total_race_distance, decay: bool = False, hill_mode: bool = False):
     """
     Estimate pace (minutes per km) based on segment distance and grade.
@@ -69,172 +215,1053 @@ def speed_calculation(base_pace, current_distance, grade, total_race_distance, d
     
     return adjusted_pace
 
+def speed_calculation_array(base_pace, current_distance, grade, total_race_distance, decay: bool = False, hill_mode: bool = False):
+    """
+    Vectorized speed_calculation over whole arrays, gives the same result element by element.
+    speed_calculation stays the scalar reference for the model.
+
+    Args:
+        base_pace (float or array-like): Base pace in min/km, an array of shape (n, 1)
+            evaluates n base paces at once
+        current_distance (array-like): Current distance in km per point
+        grade (array-like): Grade per point (NaN gets no hill adjustment)
+        total_race_distance (float): Total race distance in km
+        decay (bool): Whether to apply fatigue decay
+        hill_mode (bool): Whether to apply hill adjustments
+
+    Returns:
+        np.ndarray: Adjusted pace in min/km per point, broadcast against base_pace
+    """
+    current_distance = np.asarray(current_distance, dtype=float)
+    grade = np.asarray(grade, dtype=float)
+    base_pace = np.asarray(base_pace, dtype=float)
+    adjusted_pace = np.full(np.broadcast_shapes(base_pace.shape, current_distance.shape), base_pace, dtype=float)
+
+    if decay:
+        halfway_point = total_race_distance / 2
+        with np.errstate(divide='ignore', invalid='ignore'):
+            early = 0.05 * np.log1p(current_distance / halfway_point)
+            late = 0.05 * math.log(2) + 0.2 * np.log1p(current_distance - halfway_point)
+        adjusted_pace += np.where(current_distance <= halfway_point, early, late)
+
+    if hill_mode:
+        moderate = (grade > 0) & (grade < 20)
+        steep = grade >= 20
+        adjusted_pace += np.where(moderate, 0.08 * grade, 0.0)
+        adjusted_pace = np.where(steep, np.minimum(adjusted_pace + 0.12 * grade, 12.5), adjusted_pace)
+
+    return adjusted_pace
+
+def pace_offsets(current_distance, grade, total_race_distance, decay: bool = False, hill_mode: bool = False):
+    """
+    Decompose the pace model into pace = base_pace + offset, capped at a ceiling on steep points.
+    The parts are read off speed_calculation_array at a very low and a very high base pace.
+
+    Args:
+        current_distance (array-like): Current distance in km per point
+        grade (array-like): Grade per point
+        total_race_distance (float): Total race distance in km
+        decay (bool): Whether to apply fatigue decay
+        hill_mode (bool): Whether to apply hill adjustments
+
+    Returns:
+        tuple: (offset per point, ceiling per point where capped, boolean mask of capped points)
+    """
+    low, high = -1e6, 1e6
+    offset = speed_calculation_array(low, current_distance, grade, total_race_distance, decay, hill_mode) - low
+    at_high = speed_calculation_array(high, current_distance, grade, total_race_distance, decay, hill_mode)
+    return offset, at_high, at_high < high / 2
+
+def solve_base_pace(segment_distance, current_distance, grade, total_race_distance, target_minutes,
+                    decay: bool = False, hill_mode: bool = False):
+    """
+    Closed form inverse of speed_calculation_array: the base pace whose finish time,
+    sum(segment_distance * pace), equals target_minutes.
+
+    Every point's pace is base_pace + offset, and steep points are capped at a ceiling,
+    so the finish time is piecewise linear in base_pace with one breakpoint per steep point.
+    The offsets and ceilings are read off the pace model itself at a very low and a very
+    high base pace, then the breakpoints are sorted and the linear piece containing the
+    target is solved directly.
+
+    Args:
+        segment_distance (array-like): Distance in km covered at each point's pace
+        current_distance (array-like): Current distance in km per point
+        grade (array-like): Grade per point
+        total_race_distance (float): Total race distance in km
+        target_minutes (float): Target finish time in minutes
+        decay (bool): Whether to apply fatigue decay
+        hill_mode (bool): Whether to apply hill adjustments
+
+    Returns:
+        float: Base pace in min/km
+    """
+    weight = np.nan_to_num(np.asarray(segment_distance, dtype=float))
+    offset, at_high, capped = pace_offsets(current_distance, grade, total_race_distance, decay, hill_mode)
+
+    free_weight = weight[~capped].sum()
+    free_time = (weight * offset)[~capped].sum()
+
+    # steep points sorted by the base pace at which they hit their ceiling
+    breaks = at_high[capped] - offset[capped]
+    order = np.argsort(breaks, kind='stable')
+    breaks = breaks[order]
+    steep_weight = weight[capped][order]
+    steep_offset_time = (weight * offset)[capped][order]
+    capped_time = np.cumsum(steep_weight * at_high[capped][order])
+
+    # slope and intercept of the finish time once the first k steep points are capped, k = 0..n
+    slopes = free_weight + np.concatenate(([steep_weight.sum()], steep_weight.sum() - np.cumsum(steep_weight)))
+    intercepts = free_time + np.concatenate(([0.0], capped_time)) + \
+        np.concatenate(([steep_offset_time.sum()], steep_offset_time.sum() - np.cumsum(steep_offset_time)))
+
+    # finish time at each breakpoint, non-decreasing, so the target's piece is a binary search away
+    break_times = intercepts[1:] + slopes[1:] * breaks
+    piece = int(np.searchsorted(break_times, target_minutes, side='left'))
+    if slopes[piece] <= 0:
+        raise ValueError("Target finish time can not be reached, every point is at the pace ceiling")
+
+    base_pace = (target_minutes - intercepts[piece]) / slopes[piece]
+    if base_pace <= 0:
+        raise ValueError("Target finish time is too fast for this route and pace model")
+    return float(base_pace)
+
+def cutoff_pacing(segment_distance, current_distance, grade, total_race_distance, base_pace,
+                  cutoff_rows, deadlines, decay: bool = False, hill_mode: bool = False):
+    """
+    Most even base pace plan that reaches every cutoff row by its deadline, keeping the
+    decay and hill shape of the pace model (pace = section base pace + offset).
+
+    Taut string: from the start, the section up to the most demanding cutoff gets the
+    slowest constant base pace that still makes it, then the same is repeated from that
+    cutoff on. Section paces therefore only ever slow down, and once no remaining cutoff
+    needs it the plan falls back to base_pace. Every deadline is checked at once from
+    cumulative sums, the steep point ceiling is left out of the constraint, which can only
+    make the real plan faster than required.
+
+    Args:
+        segment_distance (array-like): Distance in km covered at each point's pace
+        current_distance (array-like): Current distance in km per point
+        grade (array-like): Grade per point
+        total_race_distance (float): Total race distance in km
+        base_pace (float): Preferred base pace in min/km, used wherever the cutoffs allow
+        cutoff_rows (array-like): Row positions of the cutoff markers
+        deadlines (array-like): Latest elapsed minutes at each cutoff row, safety margin included
+        decay (bool): Whether to apply fatigue decay
+        hill_mode (bool): Whether to apply hill adjustments
+
+    Returns:
+        np.ndarray: Base pace per point in min/km
+    """
+    weight = np.nan_to_num(np.asarray(segment_distance, dtype=float))
+    offset = pace_offsets(current_distance, grade, total_race_distance, decay, hill_mode)[0]
+    base_per_point = np.full(len(weight), float(base_pace))
+
+    order = np.argsort(cutoff_rows, kind='stable')
+    rows = np.asarray(cutoff_rows, dtype=int)[order]
+    deadlines = np.asarray(deadlines, dtype=float)[order]
+
+    # elapsed time at cutoff j with constant base b from the start is b * weights[j] + offset_time[j]
+    weights = np.cumsum(weight)[rows]
+    offset_time = np.cumsum(weight * offset)[rows]
+
+    first, start_row, used_weight, used_offset, elapsed = 0, 0, 0.0, 0.0, 0.0
+    while first < len(rows):
+        section_weight = weights[first:] - used_weight
+        available = deadlines[first:] - elapsed - (offset_time[first:] - used_offset)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            required = np.where(section_weight > 0, available / section_weight,
+                                np.where(available >= 0, np.inf, -np.inf))
+
+        binding = int(np.argmin(required))
+        if required[binding] >= base_pace:
+            break
+        if required[binding] <= 0:
+            raise ValueError(f"The cutoff at {current_distance[rows[first + binding]]:.2f} km can not be "
+                             f"reached in time with the safety buffer")
+
+        end_row = rows[first + binding] + 1
+        base_per_point[start_row:end_row] = required[binding]
+        elapsed += required[binding] * section_weight[binding] + offset_time[first + binding] - used_offset
+        used_weight, used_offset = weights[first + binding], offset_time[first + binding]
+        first, start_row = first + binding + 1, end_row
+    return base_per_point
+
+def scenario_times(segment_distance, current_distance, grade, total_race_distance, base_paces,
+                   decay: bool = False, hill_mode: bool = False, split_ends=None, chunk_points: int = 4_000_000):
+    """
+    Finish and split times for many base paces under one decay/hill setting, broadcasting
+    the pace model over (base pace, point) instead of running the pipeline per pace.
+
+    Args:
+        segment_distance (array-like): Distance in km covered at each point's pace
+        current_distance (array-like): Current distance in km per point
+        grade (array-like): Grade per point
+        total_race_distance (float): Total race distance in km
+        base_paces (array-like): Base paces in min/km
+        decay (bool): Whether to apply fatigue decay
+        hill_mode (bool): Whether to apply hill adjustments
+        split_ends (array-like): Increasing row positions that close each split (inclusive)
+        chunk_points (int): Upper bound on paces x points evaluated at once, keeps memory flat
+
+    Returns:
+        tuple: (finish minutes of shape (paces,), split minutes of shape (paces, splits))
+            where the last split runs from the last split end to the finish
+    """
+    weight = np.nan_to_num(np.asarray(segment_distance, dtype=float))
+    base_paces = np.asarray(base_paces, dtype=float).reshape(-1, 1)
+
+    # reduceat bounds: each split starts one row after the previous split's end
+    split_ends = np.asarray(split_ends if split_ends is not None else [], dtype=int)
+    starts = np.concatenate(([0], split_ends + 1))
+    starts = starts[starts < len(weight)]
+
+    rows_per_chunk = max(1, chunk_points // max(len(weight), 1))
+    splits = np.empty((len(base_paces), len(starts)))
+    for first in range(0, len(base_paces), rows_per_chunk):
+        chunk = base_paces[first:first + rows_per_chunk]
+        segment_time = weight * speed_calculation_array(chunk, current_distance, grade, total_race_distance,
+                                                        decay=decay, hill_mode=hill_mode)
+        splits[first:first + len(chunk)] = np.add.reduceat(segment_time, starts, axis=1)
+    return splits.sum(axis=1), splits
+
+def format_duration(minutes):
+    """
+    Format elapsed minutes as HH:MM:SS (hours keep counting past 24)
+
+    Args:
+        minutes (array-like): Elapsed time in minutes
+
+    Returns:
+        list: Formatted strings
+    """
+    minutes = np.asarray(minutes, dtype=float)
+    hours = (minutes // 60).astype(int)
+    mins = (minutes % 60).astype(int)
+    secs = ((minutes % 1) * 60).astype(int)
+    return [f"{h:02d}:{m:02d}:{s:02d}" for h, m, s in zip(hours, mins, secs)]
+
+def format_clock_time(clock_datetime, race_start_datetime=None):
+    """
+    Format clock times as HH:MM:SS, with a (+N) day suffix once a race runs past midnight
+
+    Args:
+        clock_datetime (Series): datetime64 clock times
+        race_start_datetime (Timestamp): Start of the race, defaults to the earliest clock time
+
+    Returns:
+        list: Formatted strings
+    """
+    clock_datetime = pd.Series(pd.to_datetime(clock_datetime)).reset_index(drop=True)
+    if race_start_datetime is None:
+        race_start_datetime = clock_datetime.min()
+    race_day = pd.Timestamp(race_start_datetime).normalize()
+
+    day_offset = (clock_datetime.dt.normalize() - race_day).dt.days
+    clock_str = clock_datetime.dt.strftime('%H:%M:%S')
+    return [clock if not day or pd.isna(day) else f"{clock} (+{int(day)})"
+            for clock, day in zip(clock_str, day_offset)]
+
+def add_time_strings(df, race_start_datetime=None):
+    """
+    Add the display columns cumulative_time_hms and clock_time to a (small) selection of rows
+
+    Args:
+        df (DataFrame): Rows with cumulative_time and optionally clock_datetime
+        race_start_datetime (Timestamp): Start of the race for the day suffix of clock times
+
+    Returns:
+        DataFrame: df with the string columns added
+    """
+    df['cumulative_time_hms'] = format_duration(df['cumulative_time'].to_numpy())
+    if 'clock_datetime' in df.columns:
+        df['clock_time'] = format_clock_time(df['clock_datetime'], race_start_datetime)
+    return df
+
+GPX_PARSERS = ('gpxpy', 'stream')
+WAYPOINT_COLUMNS = ['name', 'latitude', 'longitude']
+
+# Bump whenever loading or distance output changes so cached routes are invalidated
+PARSER_VERSION = 2
+
+def uphill_downhill(elevations, segment_starts=(0,)):
+    """
+    Total uphill and downhill in metres, matching gpxpy's get_uphill_downhill().
+    Within each track segment missing elevations are dropped, interior points are
+    smoothed with 0.3/0.4/0.3 weights and the positive/negative steps are summed.
+
+    Args:
+        elevations (array-like): Elevation per trackpoint in metres (NaN if missing)
+        segment_starts (array-like): Index of the first point of each track segment
+
+    Returns:
+        tuple: (uphill, downhill) in metres
+    """
+    elevations = np.asarray(elevations, dtype=float)
+    bounds = list(segment_starts) + [len(elevations)]
+    uphill, downhill = 0.0, 0.0
+
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        ele = elevations[start:end]
+        ele = ele[~np.isnan(ele)]
+        if len(ele) < 2:
+            continue
+        smoothed = ele.copy()
+        smoothed[1:-1] = ele[:-2] * .3 + ele[1:-1] * .4 + ele[2:] * .3
+        steps = np.diff(smoothed)
+        uphill += steps[steps > 0].sum()
+        downhill -= steps[steps <= 0].sum()
+
+    return float(uphill), float(downhill)
+
+class _PointBuffer:
+    """Preallocated (n, 3) float array of latitude/longitude/elevation that doubles in size when full"""
+    def __init__(self, capacity: int = 4096):
+        self.data = np.empty((max(capacity, 1), 3))
+        self.size = 0
+
+    def append(self, lat, lon, ele):
+        if self.size == len(self.data):
+            grown = np.empty((len(self.data) * 2, 3))
+            grown[:self.size] = self.data
+            self.data = grown
+        self.data[self.size] = (lat, lon, ele)
+        self.size += 1
+
+    def view(self):
+        return self.data[:self.size]
+
+class _GPXStreamParser:
+    """
+    Incremental expat parser that reads trkpt/ele elements straight into a _PointBuffer,
+    plus the name and position of every wpt.
+    Never builds an element tree, so memory stays flat apart from the point arrays.
+    """
+    # rough number of bytes per <trkpt> block, only used to size the first buffer
+    BYTES_PER_POINT = 60
+
+    def __init__(self, size_hint: int = 0):
+        self.points = _PointBuffer(size_hint // self.BYTES_PER_POINT)
+        self.segment_starts = []
+        self.track_name = None
+        self.waypoints = []  # (name, lat, lon) of every <wpt>
+        self._path = []
+        self._text = []
+        self._point = None
+        self._waypoint = None
+
+        self._parser = expat.ParserCreate(namespace_separator='}')
+        self._parser.buffer_text = True
+        self._parser.StartElementHandler = self._start
+        self._parser.EndElementHandler = self._end
+        self._parser.CharacterDataHandler = self._characters
+
+    @staticmethod
+    def _local(name):
+        return name.rpartition('}')[2]
+
+    def _start(self, name, attrs):
+        tag = self._local(name)
+        if tag == 'trkseg':
+            self.segment_starts.append(self.points.size)
+        elif tag == 'trkpt':
+            self._point = [float(attrs['lat']), float(attrs['lon']), np.nan]
+        elif tag == 'wpt':
+            self._waypoint = ['', float(attrs['lat']), float(attrs['lon'])]
+        elif tag in ('ele', 'name'):
+            self._text = []
+        self._path.append(tag)
+
+    def _end(self, name):
+        tag = self._path.pop()
+        if tag == 'trkpt' and self._point is not None:
+            self.points.append(*self._point)
+            self._point = None
+        elif tag == 'ele' and self._point is not None and self._path[-1] == 'trkpt':
+            text = ''.join(self._text).strip()
+            if text:
+                self._point[2] = float(text)
+        elif tag == 'name' and self._path[-1] == 'trk' and self.track_name is None:
+            self.track_name = ''.join(self._text).strip()
+        elif tag == 'name' and self._path[-1] == 'wpt' and self._waypoint is not None:
+            self._waypoint[0] = ''.join(self._text).strip()
+        elif tag == 'wpt' and self._waypoint is not None:
+            self.waypoints.append(tuple(self._waypoint))
+            self._waypoint = None
+
+    def _characters(self, data):
+        self._text.append(data)
+
+    def parse_file(self, file_obj):
+        self._parser.ParseFile(file_obj)
+        return self
+
+    def parse_buffer(self, buffer, chunk_size: int = 1024 * 1024):
+        # memoryview slices share the caller's memory, so in-memory uploads are never copied
+        for start in range(0, len(buffer), chunk_size):
+            self._parser.Parse(buffer[start:start + chunk_size], False)
+        self._parser.Parse(b'', True)
+        return self
+
+# Split lengths in km that find_split_markers understands by name
+SPLIT_INTERVALS = {'km': 1.0, 'mile': 1.60934, '5km': 5.0}
+
+def nearest_indices(cumulative, targets):
+    """
+    Position of the value closest to each target in a non-decreasing array.
+    Ties go to the first occurrence, same as idxmin on the absolute difference.
+
+    Args:
+        cumulative (np.ndarray): Non-decreasing values, e.g. total_distance
+        targets (array-like): Values to look up
+
+    Returns:
+        np.ndarray: Integer positions into cumulative
+    """
+    targets = np.asarray(targets, dtype=float)
+    right = np.clip(np.searchsorted(cumulative, targets, side='left'), 0, len(cumulative) - 1)
+    left = np.clip(right - 1, 0, len(cumulative) - 1)
+    # first occurrence of the value just below the target (zero length segments repeat it)
+    left = np.searchsorted(cumulative, cumulative[left], side='left')
+
+    use_left = np.abs(cumulative[left] - targets) <= np.abs(cumulative[right] - targets)
+    return np.where(use_left, left, right)
+
+GRADE_MODES = ('elevation_change', 'percent')
+
+def split_starts(labels):
+    """
+    Start position of each run of equal split labels, e.g. the forward filled km_number.
+    Rows before the first label do not belong to any split.
+
+    Args:
+        labels (array-like): Split label per point, NaN where unlabelled
+
+    Returns:
+        np.ndarray: Integer positions where a new split begins
+    """
+    labels = np.asarray(labels, dtype=float)
+    changed = np.ones(len(labels), dtype=bool)
+    changed[1:] = labels[1:] != labels[:-1]
+    return np.flatnonzero(changed & ~np.isnan(labels))
+
+def split_grades(total_distance, elevation, starts, mode: str = 'elevation_change'):
+    """
+    Grade of every split from its first and last point that has an elevation,
+    found with a binary search over the valid points instead of a groupby.
+
+    Args:
+        total_distance (np.ndarray): Cumulative distance in km per point
+        elevation (np.ndarray): Elevation in m per point, NaN where missing
+        starts (np.ndarray): Start position of each split (see split_starts)
+        mode (str): 'elevation_change' for metres gained over the split (the unit the
+            pace model thresholds were tuned on) or 'percent' for rise over the split's real length
+
+    Returns:
+        np.ndarray: Grade per split, NaN for splits without any elevation
+    """
+    grades = np.full(len(starts), np.nan)
+    valid = np.flatnonzero(~np.isnan(elevation))
+    if len(starts) == 0 or len(valid) == 0:
+        return grades
+
+    ends = np.append(starts[1:], len(elevation))
+    first = np.searchsorted(valid, starts, side='left')
+    last = np.searchsorted(valid, ends, side='left') - 1
+    has_elevation = last >= first
+
+    first_pos = valid[np.minimum(first, len(valid) - 1)][has_elevation]
+    last_pos = valid[np.maximum(last, 0)][has_elevation]
+    change = elevation[last_pos] - elevation[first_pos]
+
+    if mode == 'percent':
+        length_m = (total_distance[last_pos] - total_distance[first_pos]) * 1000
+        change = np.divide(change * 100, length_m, out=np.zeros_like(change), where=length_m > 0)
+    grades[has_elevation] = change
+    return grades
+
+def rolling_grade(total_distance, elevation, window_km: float, mode: str = 'elevation_change'):
+    """
+    Grade at every point over a distance window centred on it, interpolating the elevation
+    at both window edges. The window is clipped at the start and finish of the route.
+
+    Args:
+        total_distance (np.ndarray): Cumulative distance in km per point
+        elevation (np.ndarray): Elevation in m per point, NaN where missing
+        window_km (float): Window length in km
+        mode (str): 'elevation_change' for metres per km or 'percent'
+
+    Returns:
+        np.ndarray: Grade per point
+    """
+    valid = ~np.isnan(elevation)
+    if valid.sum() < 2:
+        return np.full(len(elevation), np.nan)
+    distance, height = total_distance[valid], elevation[valid]
+
+    low = np.clip(total_distance - window_km / 2, distance[0], distance[-1])
+    high = np.clip(total_distance + window_km / 2, distance[0], distance[-1])
+    rise = np.interp(high, distance, height) - np.interp(low, distance, height)
+    run = high - low
+    grade = np.divide(rise, run, out=np.zeros_like(rise), where=run > 0)
+    return grade / 10 if mode == 'percent' else grade
+
+def simplify_track(latitudes, longitudes, elevations, tolerance_m: float, segment_starts=(0,)):
+    """
+    Douglas-Peucker simplification of a track in 3D (local metres east/north plus elevation).
+    Every open interval of one recursion level is processed at once: the interior points of
+    all intervals are gathered into one array, each interval's farthest point is found with
+    a reduceat, and intervals whose farthest point is beyond the tolerance are split there.
+    Each level costs O(points) and typical tracks need a few dozen levels.
+
+    Args:
+        latitudes, longitudes (array-like): Coordinates in degrees
+        elevations (array-like): Elevation in metres, missing values are interpolated
+        tolerance_m (float): Maximum distance in metres of any dropped point from the kept line
+        segment_starts (array-like): First point of every track segment, segment ends are always kept
+
+    Returns:
+        np.ndarray: Boolean mask of the points to keep
+    """
+    if tolerance_m < 0:
+        raise ValueError("tolerance_m must not be negative")
+    lats = np.asarray(latitudes, dtype=float)
+    lons = np.asarray(longitudes, dtype=float)
+    n = len(lats)
+    keep = np.ones(n, dtype=bool)
+    if n < 3:
+        return keep
+
+    ele = np.asarray(elevations, dtype=float)
+    valid = ~np.isnan(ele)
+    z = np.interp(np.arange(n), np.flatnonzero(valid), ele[valid]) if valid.any() else np.zeros(n)
+    lat0 = np.radians(np.nanmean(lats))
+    x = EARTH_MEAN_RADIUS * 1000 * np.radians(lons) * np.cos(lat0)
+    y = EARTH_MEAN_RADIUS * 1000 * np.radians(lats)
+
+    # Track segments are simplified independently, their first and last points stay
+    bounds = np.unique(np.clip(np.concatenate((segment_starts, [n])), 0, n))
+    starts, ends = bounds[:-1], bounds[1:] - 1
+    keep[:] = False
+    keep[starts] = True
+    keep[ends] = True
+    tolerance2 = tolerance_m ** 2
+
+    while len(starts):
+        counts = ends - starts - 1
+        open_intervals = counts > 0
+        starts, ends, counts = starts[open_intervals], ends[open_intervals], counts[open_intervals]
+        if len(starts) == 0:
+            break
+
+        # interior points of every open interval, flattened
+        offsets = np.cumsum(counts) - counts
+        rows = np.arange(counts.sum()) - np.repeat(offsets - starts - 1, counts)
+
+        # squared distance of each point from its interval's chord, per interval values
+        # are computed once and repeated over the interval's points
+        chord = [np.repeat(c[ends] - c[starts], counts) for c in (x, y, z)]
+        offset = [c[rows] - np.repeat(c[starts], counts) for c in (x, y, z)]
+        length2 = chord[0] ** 2 + chord[1] ** 2 + chord[2] ** 2
+        t = offset[0] * chord[0] + offset[1] * chord[1] + offset[2] * chord[2]
+        t = np.clip(np.divide(t, length2, out=np.zeros(len(rows)), where=length2 > 0), 0, 1)
+        distance2 = (offset[0] - t * chord[0]) ** 2 + (offset[1] - t * chord[1]) ** 2 + (offset[2] - t * chord[2]) ** 2
+
+        # farthest point per interval (the first one on ties), split where it is out of tolerance
+        farthest = np.maximum.reduceat(distance2, offsets)
+        split = farthest > tolerance2
+        at_max = np.flatnonzero(distance2 == np.repeat(np.where(split, farthest, np.inf), counts))
+        at_max = at_max[np.unique(np.searchsorted(offsets, at_max, side='right'), return_index=True)[1]]
+        pivots = rows[at_max]
+        keep[pivots] = True
+        starts = np.concatenate((starts[split], pivots))
+        ends = np.concatenate((pivots, ends[split]))
+
+    return keep
+
+def gpx_buffer(source):
+    """
+    Byte view of GPX content held in memory
+
+    Args:
+        source: Path to a GPX file, or its content as bytes, bytearray or memoryview
+
+    Returns:
+        memoryview: Unsigned byte view over the content (no copy), None when source is a path
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return memoryview(source).cast('B')
+    return None
+
 class GPXAnalyzer:
-    def __init__(self, gpx_file_path):
+    # gpx_file_path is a path or the file content as bytes/bytearray/memoryview (e.g. an upload)
+    def __init__(self, gpx_file_path, parser: str = 'gpxpy'):
+        if parser not in GPX_PARSERS:
+            raise ValueError(f"Unknown parser '{parser}', expected one of {GPX_PARSERS}")
         self.gpx_file_path = gpx_file_path
+        self.parser = parser
+        self.source_hash = None
         self.gpx_parsed = None
         self.df = None
         self.final_df = None
         self.km_markers = {}
+        self.loops = 1
+        self.lap_size = 0
+        self.race_start_datetime = None
+        self.base_pace = None  # base pace the current paces were computed with
+        self.track_name = None
+        self.uphill = 0.0
+        self.downhill = 0.0
+        self.waypoints = pd.DataFrame(columns=WAYPOINT_COLUMNS)  # the file's <wpt> elements
+        self.segment_starts = [0]  # first row of every track segment in df
+        self.simplification = None  # report of the last simplify() run
         
+    @instrumented()
     def load_gpx(self):
-        with open(self.gpx_file_path, 'r') as gpx_file:
-            self.gpx_parsed = gpxpy.parse(gpx_file)
+        if self.parser == 'stream':
+            self._load_gpx_stream()
+        else:
+            self._load_gpx_gpxpy()
+
+        #finding elevation data if none given 
+        if self.df['elevation'].isnull().all():
+            self.df['elevation'] = 0
+
+    def _load_gpx_gpxpy(self):
+        buffer = gpx_buffer(self.gpx_file_path)
+        if buffer is not None:
+            self.gpx_parsed = gpxpy.parse(io.BytesIO(buffer))
+        else:
+            with open(self.gpx_file_path, 'r') as gpx_file:
+                self.gpx_parsed = gpxpy.parse(gpx_file)
 
         # Extract track points (latitude, longitude, elevation)
         points = []
+        self.segment_starts = []
         for track in self.gpx_parsed.tracks:
             for segment in track.segments:
+                self.segment_starts.append(len(points))
                 for point in segment.points:
                     points.append((point.latitude, point.longitude, point.elevation))
 
         # You can then convert these points into a Pandas DataFrame for easier manipulation
         self.df = pd.DataFrame(points, columns=['latitude', 'longitude', 'elevation'])
 
-        #finding elevation data if none given 
-        if self.df['elevation'].isnull().all():
-            self.df['elevation'] = 0
+        if self.gpx_parsed.tracks:
+            self.track_name = self.gpx_parsed.tracks[0].name
+        self.uphill, self.downhill = self.gpx_parsed.get_uphill_downhill()
+        self.waypoints = pd.DataFrame([(w.name or '', w.latitude, w.longitude) for w in self.gpx_parsed.waypoints],
+                                      columns=WAYPOINT_COLUMNS)
+
+    def _load_gpx_stream(self):
+        # Stream trkpt/ele elements into arrays without building the gpxpy object tree
+        buffer = gpx_buffer(self.gpx_file_path)
+        if buffer is not None:
+            stream = _GPXStreamParser(len(buffer)).parse_buffer(buffer)
+        else:
+            with open(self.gpx_file_path, 'rb') as gpx_file:
+                stream = _GPXStreamParser(os.fstat(gpx_file.fileno()).st_size).parse_file(gpx_file)
+
+        self.df = pd.DataFrame(stream.points.view(), columns=['latitude', 'longitude', 'elevation'])
+        self.track_name = stream.track_name
+        self.uphill, self.downhill = uphill_downhill(stream.points.view()[:, 2], stream.segment_starts)
+        self.segment_starts = stream.segment_starts
+        self.waypoints = pd.DataFrame(stream.waypoints, columns=WAYPOINT_COLUMNS)
+
+    @instrumented()
+    def simplify(self, tolerance_m: float = 2.0):
+        """
+        Drop trackpoints that lie within tolerance_m of the simplified line (Douglas-Peucker,
+        elevation included), run after load_gpx and before map_adjustment. The route's
+        uphill/downhill stay the values measured on the full track.
+
+        Args:
+            tolerance_m (float): Maximum distance in metres of a dropped point from the kept line
+
+        Returns:
+            dict: points_before/points_after, distance_before_km/distance_after_km with
+                distance_change_pct, elevation_gain_before_m/elevation_gain_after_m with
+                elevation_gain_change_pct, and tolerance_m
+        """
+        if self.df is None:
+            raise ValueError("No track loaded. Call load_gpx() first.")
+        lats = self.df['latitude'].to_numpy(dtype=float)
+        lons = self.df['longitude'].to_numpy(dtype=float)
+        elevation = self.df['elevation'].to_numpy(dtype=float)
+        keep = simplify_track(lats, lons, elevation, tolerance_m, self.segment_starts)
+
+        # segment starts are always kept, so they map onto the simplified rows
+        kept_before = np.cumsum(keep) - keep
+        segment_starts = [int(kept_before[start]) for start in self.segment_starts if start < len(keep)]
+
+        # Fidelity of the simplified track, jumps between segments are not counted. The gain is the
+        # sum of rises between consecutive points, what split grades see; the smoothed gpxpy figure
+        # would also shift just because smoothing neighbours are further apart after simplifying
+        def route_stats(rows, starts):
+            steps = segment_distances(lats[rows], lons[rows], method='haversine')
+            rises = np.diff(elevation[rows], prepend=np.nan)
+            steps[np.asarray(starts, dtype=int)] = 0.0
+            rises[np.asarray(starts, dtype=int)] = 0.0
+            return float(steps.sum()), float(np.nansum(np.clip(rises, 0, None)))
+
+        distance_before, gain_before = route_stats(np.arange(len(keep)), self.segment_starts or [0])
+        distance_after, gain_after = route_stats(np.flatnonzero(keep), segment_starts or [0])
+
+        self.df = self.df[keep].reset_index(drop=True)
+        self.segment_starts = segment_starts
+        self.simplification = {
+            'tolerance_m': tolerance_m,
+            'points_before': int(len(keep)),
+            'points_after': int(keep.sum()),
+            'distance_before_km': round(distance_before, 4),
+            'distance_after_km': round(distance_after, 4),
+            'distance_change_pct': round(100 * (distance_after / distance_before - 1), 3) if distance_before else 0.0,
+            'elevation_gain_before_m': round(gain_before, 1),
+            'elevation_gain_after_m': round(gain_after, 1),
+            'elevation_gain_change_pct': round(100 * (gain_after / gain_before - 1), 3) if gain_before else 0.0,
+        }
+        return self.simplification
 
     #right now only allows for looping
+    @instrumented()
     def map_adjustment(self, loops: int = 0):
 
-        #looping input gpx route by concatenating
+        #looping input gpx route by tiling one lap, every column is allocated once
         if loops > 0:
-            loop_holder = []
-            for _ in range(loops):
-                copy_df = self.df.copy()  # Create a copy of the DataFrame
-                copy_df['lap'] = _ + 1  # Add a column to indicate the loop number
-                loop_holder.append(copy_df)
-            self.final_df = pd.concat(loop_holder, axis=0).reset_index(drop=True)
+            lap_size = len(self.df)
+            self.final_df = pd.DataFrame({col: np.tile(self.df[col].to_numpy(), loops) for col in self.df.columns})
+            self.final_df['lap'] = np.repeat(np.arange(1, loops + 1), lap_size)  # Add a column to indicate the loop number
+            self.lap_size = lap_size
         else:
             self.df['loop'] = 1  # Add a column to indicate the loop number
             self.final_df = self.df
+            self.lap_size = len(self.df)
+        self.loops = max(loops, 1)
 
 
-    def calculate_distances(self):
-        def calculate_segment_distances(df):
-            # Get previous row coordinates using shift()
-            prev_coords = list(zip(df['latitude'].shift(1), df['longitude'].shift(1)))
-            curr_coords = list(zip(df['latitude'], df['longitude']))
-            
-            distances = []
-            for i, (curr, prev) in enumerate(zip(curr_coords, prev_coords)):
-                if i == 0 or pd.isna(prev[0]):  # First row has no previous
-                    distances.append(0.0)
-                else:
-                    distances.append(geodesic(prev, curr).kilometers)
-    
-            return distances
-        
-        self.final_df['segment_distance'] = calculate_segment_distances(self.final_df)
-        self.final_df['total_distance'] = self.final_df['segment_distance'].cumsum()
+    @instrumented()
+    def calculate_distances(self, method: str = 'ellipsoidal'):
+        # All segment distances in one vectorized pass, see segment_distances for the methods
+        lats = self.final_df['latitude'].to_numpy()
+        lons = self.final_df['longitude'].to_numpy()
+
+        if self.loops > 1 and len(self.final_df) == self.lap_size * self.loops and self.lap_size > 0:
+            # Laps are identical, so compute one lap plus the segment joining the finish back to the
+            # start and tile them with cumulative offsets instead of measuring every lap again
+            lap_segments = segment_distances(lats[:self.lap_size], lons[:self.lap_size], method=method)
+            join = segment_distances(lats[[self.lap_size - 1, 0]], lons[[self.lap_size - 1, 0]], method=method)[1]
+
+            segment = np.tile(lap_segments, self.loops)
+            segment[self.lap_size::self.lap_size] = join
+
+            lap_cumulative = np.cumsum(lap_segments)
+            lap_offsets = np.arange(self.loops) * (lap_cumulative[-1] + join)
+            self.final_df['segment_distance'] = segment
+            self.final_df['total_distance'] = (lap_cumulative[np.newaxis, :] + lap_offsets[:, np.newaxis]).ravel()
+        else:
+            self.final_df['segment_distance'] = segment_distances(lats, lons, method=method)
+            self.final_df['total_distance'] = self.final_df['segment_distance'].cumsum()
     
-    def find_kilometer_markers(self):
-        # Find the row index closest to each whole kilometer
-        def find_kilometer_markers(df):
-            """
-            For each whole kilometer, find the row index that has the closest total_distance
-            """
-            max_distance = int(df['total_distance'].max()) + 1
-            kilometer_markers = {}
-            
-            for km in range(max_distance):
-                # Find the index of the row closest to this kilometer
-                differences = np.abs(df['total_distance'] - km)
-                closest_idx = differences.idxmin()
-                kilometer_markers[km] = closest_idx
-            
-            return kilometer_markers
+    def find_split_markers(self, interval=1.0, splits=None):
+        """
+        For each split distance, find the row index with the closest total_distance.
+        All splits are found with one binary search over the cumulative distance array,
+        so any unit can be asked for without re-running the pipeline.
 
-        # Get the kilometer markers
-        km_markers = find_kilometer_markers(self.final_df)
+        Args:
+            interval (float or str): Split length in km, or a key of SPLIT_INTERVALS ('km', 'mile', '5km')
+            splits (array-like): Custom split distances in km, overrides interval
 
-        # Create a column that indicates if this row is a kilometer marker
-        self.final_df['is_km_marker'] = 0
-        self.final_df['km_number'] = np.nan
+        Returns:
+            dict: {split_number: row_index}, split_number is the multiple of interval
+                (or the position in splits for a custom list)
+        """
+        total_distance = self.final_df['total_distance'].to_numpy(dtype=float)
+
+        if splits is not None:
+            targets = np.asarray(splits, dtype=float)
+        else:
+            if isinstance(interval, str):
+                if interval not in SPLIT_INTERVALS:
+                    raise ValueError(f"Unknown split interval '{interval}', expected a distance in km "
+                                     f"or one of {tuple(SPLIT_INTERVALS)}")
+                interval = SPLIT_INTERVALS[interval]
+            if interval <= 0:
+                raise ValueError("interval must be positive")
+            targets = np.arange(int(total_distance.max() / interval) + 1) * interval
 
-        # Mark the kilometer marker rows
-        for km, row_idx in km_markers.items():
-            self.final_df.loc[row_idx, 'is_km_marker'] = 1
-            self.final_df.loc[row_idx, 'km_number'] = km
+        positions = nearest_indices(total_distance, targets)
+        return dict(zip(range(len(targets)), self.final_df.index[positions]))
+
+    @instrumented()
+    def find_kilometer_markers(self, interval=1.0, splits=None):
+        # Find the row index closest to each whole kilometer (or other split, see find_split_markers)
+        self.km_markers = self.find_split_markers(interval=interval, splits=splits)
+
+        # Write the marker columns in one vectorized pass
+        is_km_marker = np.zeros(len(self.final_df), dtype=int)
+        km_number = np.full(len(self.final_df), np.nan)
+
+        positions = self.final_df.index.get_indexer(list(self.km_markers.values()))
+        numbers = np.fromiter(self.km_markers.keys(), dtype=float, count=len(self.km_markers))
+        # when two splits land on the same row the later split wins
+        unique_positions, last = np.unique(positions[::-1], return_index=True)
+        is_km_marker[unique_positions] = 1
+        km_number[unique_positions] = numbers[::-1][last]
+
+        self.final_df['is_km_marker'] = is_km_marker
+        self.final_df['km_number'] = km_number
 
 class PaceCalculator:
     def __init__(self, gpx_analyzer, base_pace):
         self.gpx_analyzer = gpx_analyzer
         self.base_pace = base_pace
         
-    def calculate_pace(self, decay=False, hill_mode=False):
+    @instrumented()
+    def calculate_pace(self, decay=False, hill_mode=False, grade_mode='elevation_change', grade_window=None):
+        # Grade only depends on the route, pace on the model options
+        self.calculate_grade(mode=grade_mode, window_km=grade_window)
+        self.apply_pace_model(decay=decay, hill_mode=hill_mode)
+
+    @instrumented()
+    def calculate_grade(self, mode='elevation_change', window_km=None):
+        """
+        Write grade and segment_gain onto final_df in place
+
+        Args:
+            mode (str): 'elevation_change' (metres gained per split, what the hill model is tuned on)
+                or 'percent' (true percentage grade over the split length)
+            window_km (float): If set, grade over a rolling distance window centred on each point
+                instead of per split
+        """
+        if mode not in GRADE_MODES:
+            raise ValueError(f"Unknown grade mode '{mode}', expected one of {GRADE_MODES}")
+        if window_km is not None and window_km <= 0:
+            raise ValueError("window_km must be positive")
 
         #creating local reference
         df = self.gpx_analyzer.final_df
-        
-        #calculating grade per km segment
+        total_distance = df['total_distance'].to_numpy(dtype=float)
+        elevation = df['elevation'].to_numpy(dtype=float)
+
+        #every point belongs to the split of the last marker before it
         df['km_number'] = df['km_number'].ffill()
 
-        grade_per_km = df.groupby('km_number')['elevation'].agg(['first', 'last'])
-        grade_per_km['elevation_change'] = grade_per_km['last'] - grade_per_km['first']
-        grade_per_km['grade'] = grade_per_km['elevation_change'] / 1.0  # since it's per km, divide by 1 km
-        grade_per_km.reset_index(inplace=True)
+        if window_km is not None:
+            grade = rolling_grade(total_distance, elevation, window_km, mode=mode)
+        else:
+            #grade per split, broadcast back over the split's points
+            starts = split_starts(df['km_number'].to_numpy())
+            grade = np.full(len(df), np.nan)
+            if len(starts):
+                lengths = np.diff(np.append(starts, len(df)))
+                grade[starts[0]:] = np.repeat(split_grades(total_distance, elevation, starts, mode=mode), lengths)
+        df['grade'] = grade
 
-        #Calculate the grade between each point
-        df = df.merge(grade_per_km[['km_number', 'grade']], on='km_number', how='left', suffixes=('', '_per_km'))
+        #segment gain
+        segment_gain = np.full(len(df), np.nan)
+        segment_gain[1:] = np.diff(elevation)
+        df['segment_gain'] = segment_gain
 
-        #segment gain 
-        df['segment_gain'] = df['elevation'].diff()
+    @instrumented()
+    def apply_pace_model(self, decay=False, hill_mode=False):
+        # Requires calculate_grade() to have run
+        df = self.gpx_analyzer.final_df
 
         # Get total race distance for decay calculation
         total_race_distance = df['total_distance'].max()
 
-        # Use the base_pace provided by the user (not hardcoded)
-        df['pace'] = df.apply(
-            lambda row: speed_calculation(
-                self.base_pace,  # Use instance variable instead of hardcoded value
-                row['total_distance'], 
-                row['grade'], 
-                total_race_distance,
-                decay=decay,  # Use parameter passed to method
-                hill_mode=hill_mode  # Use parameter passed to method
-            ), 
-            axis=1
+        # Use the base_pace provided by the user, evaluated for every point at once
+        self.gpx_analyzer.base_pace = self.base_pace
+        df['pace'] = speed_calculation_array(
+            self.base_pace,
+            df['total_distance'].to_numpy(),
+            df['grade'].to_numpy(),
+            total_race_distance,
+            decay=decay,
+            hill_mode=hill_mode
         )
-        
-        # Assign the modified df back to the analyzer
-        self.gpx_analyzer.final_df = df
     
+    @instrumented()
+    def solve_base_pace(self, target_minutes, decay=False, hill_mode=False):
+        """
+        Set base_pace to the pace that finishes in target_minutes under the given model options.
+        Requires calculate_grade() to have run, follow with apply_pace_model() and calculate_times().
+
+        Args:
+            target_minutes (float): Target finish time in minutes
+            decay (bool): Whether to apply fatigue decay
+            hill_mode (bool): Whether to apply hill adjustments
+
+        Returns:
+            float: The solved base pace in min/km
+        """
+        if target_minutes is None or target_minutes <= 0:
+            raise ValueError("target_minutes must be positive")
+        df = self.gpx_analyzer.final_df
+        self.base_pace = solve_base_pace(
+            df['segment_distance'].to_numpy(),
+            df['total_distance'].to_numpy(),
+            df['grade'].to_numpy(),
+            df['total_distance'].max(),
+            target_minutes,
+            decay=decay,
+            hill_mode=hill_mode
+        )
+        return self.base_pace
+
+    @instrumented()
+    def optimize_cutoff_pacing(self, cutoff_rows, deadlines, safety_buffer=0.0, decay=False, hill_mode=False):
+        """
+        Replan paces so every cutoff is cleared by safety_buffer minutes with the most even
+        effort, then recompute segment and cumulative times. Requires calculate_grade() to have run.
+
+        Args:
+            cutoff_rows (array-like): Row positions of the cutoff markers in final_df
+            deadlines (array-like): Elapsed minutes at which each cutoff closes
+            safety_buffer (float): Minutes to arrive before each cutoff
+            decay (bool): Whether to apply fatigue decay
+            hill_mode (bool): Whether to apply hill adjustments
+
+        Returns:
+            pd.Series: Base pace per point, also stored in final_df['section_base_pace']
+        """
+        df = self.gpx_analyzer.final_df
+        total_race_distance = df['total_distance'].max()
+        base_per_point = cutoff_pacing(
+            df['segment_distance'].to_numpy(),
+            df['total_distance'].to_numpy(),
+            df['grade'].to_numpy(),
+            total_race_distance,
+            self.base_pace,
+            cutoff_rows,
+            np.asarray(deadlines, dtype=float) - safety_buffer,
+            decay=decay,
+            hill_mode=hill_mode
+        )
+        df['section_base_pace'] = base_per_point
+        df['pace'] = speed_calculation_array(
+            base_per_point,
+            df['total_distance'].to_numpy(),
+            df['grade'].to_numpy(),
+            total_race_distance,
+            decay=decay,
+            hill_mode=hill_mode
+        )
+        self.calculate_times()
+        return df['section_base_pace']
+
+    @instrumented()
     def calculate_times(self):
         # Calculate segment and cumulative times using df
         df = self.gpx_analyzer.final_df
-        # Add your pace calculation logic here
-        # Calculate segment times and cumulative time
+        # Calculate segment times and cumulative time (minutes), strings are formatted
+        # later by add_time_strings for the rows that are actually shown
         df['segment_time'] = df['segment_distance'] * df['pace']  # time in minutes
         df['cumulative_time'] = df['segment_time'].cumsum()
 
-        # Convert cumulative time to hours:minutes:seconds format
-        def minutes_to_hms(minutes):
-            hours = int(minutes // 60)
-            mins = int(minutes % 60)
-            secs = int((minutes % 1) * 60)
-            return f"{hours:02d}:{mins:02d}:{secs:02d}"
+        self.gpx_analyzer.final_df = df
 
-        df['cumulative_time_hms'] = df['cumulative_time'].apply(minutes_to_hms)
+    @instrumented()
+    def scenario_grid(self, base_paces, decays=(False, True), hill_modes=(False, True)):
+        """
+        Compare every combination of base pace x decay x hill mode on the analyzed route.
+        Requires calculate_grade() to have run, final_df itself is not modified.
 
-        self.gpx_analyzer.final_df = df
+        Args:
+            base_paces (array-like): Base paces in min/km
+            decays (tuple): Decay settings to include
+            hill_modes (tuple): Hill mode settings to include
+
+        Returns:
+            tuple: (summary DataFrame with one row per scenario: base_pace, decay, hill_mode,
+                finish_minutes and average_pace, split DataFrame of split minutes per scenario
+                with one column per split marker number plus 'finish')
+        """
+        df = self.gpx_analyzer.final_df
+        total_race_distance = df['total_distance'].max()
+
+        # splits close at the kilometer marker rows after the start, when several markers
+        # share a row (a long gap between points) the later marker wins like in the table
+        marker_numbers = np.array(sorted(self.gpx_analyzer.km_markers))
+        marker_rows = df.index.get_indexer([self.gpx_analyzer.km_markers[n] for n in marker_numbers])
+        split_ends, last = np.unique(marker_rows[::-1], return_index=True)
+        split_labels = marker_numbers[::-1][last].tolist()
+        split_labels = [n for n, row in zip(split_labels, split_ends) if row > 0]
+        split_ends = split_ends[split_ends > 0]
+        if len(split_ends) == 0 or split_ends[-1] < len(df) - 1:
+            split_labels.append('finish')
+
+        summaries, split_frames = [], []
+        base_paces = np.asarray(base_paces, dtype=float)
+        for decay in decays:
+            for hill_mode in hill_modes:
+                finish, splits = scenario_times(
+                    df['segment_distance'].to_numpy(),
+                    df['total_distance'].to_numpy(),
+                    df['grade'].to_numpy(),
+                    total_race_distance,
+                    base_paces,
+                    decay=decay,
+                    hill_mode=hill_mode,
+                    split_ends=split_ends
+                )
+                summaries.append(pd.DataFrame({
+                    'base_pace': base_paces,
+                    'decay': decay,
+                    'hill_mode': hill_mode,
+                    'finish_minutes': finish,
+                    'average_pace': finish / total_race_distance if total_race_distance else np.nan,
+                }))
+                split_frames.append(pd.DataFrame(splits, columns=split_labels))
+
+        summary = pd.concat(summaries, ignore_index=True)
+        split_times = pd.concat(split_frames, ignore_index=True)
+        return summary, split_times
 
-    def calculate_clock_times(self, race_start_time):
+    @instrumented()
+    def calculate_clock_times(self, race_start_time, race_date=None):
         # Calculate clock times based on race start time
         df = self.gpx_analyzer.final_df
         # Ensure race_start_time is a datetime.time object
         if not isinstance(race_start_time, datetime.time):
             raise ValueError("race_start_time must be a datetime.time object")
-        
-        df['clock_time'] = df['cumulative_time'].apply(
-            lambda x: (datetime.datetime.combine(datetime.date.today(), race_start_time) + datetime.timedelta(minutes=x)).strftime('%H:%M:%S')
-        )
 
+        # Anchor on a real date so clock times past midnight roll over to the next day
+        race_date = race_date or datetime.date.today()
+        race_start = pd.Timestamp(datetime.datetime.combine(race_date, race_start_time))
+        df['clock_datetime'] = race_start + pd.to_timedelta(df['cumulative_time'].to_numpy(), unit='m')
+
+        self.gpx_analyzer.race_start_datetime = race_start
         self.gpx_analyzer.final_df = df
 
 
+MARKER_RENDER_MODES = ('geojson', 'markers')
+LAP_COLORS = ['blue', 'green', 'red', 'purple', 'orange']
+
 class MapVisualizer:
+    # Shared pointToLayer for the GeoJSON marker layer: rotated arrow icons for features with a
+    # bearing, circle markers otherwise, drawn exactly like the per-marker folium objects
+    _POINT_TO_LAYER = JsCode("""
+        function(feature, latlng) {
+            var p = feature.properties;
+            if (p.bearing === null) {
+                return L.circleMarker(latlng, {radius: p.radius, color: p.color, fillColor: p.color,
+                                               fillOpacity: p.fill_opacity, weight: p.weight});
+            }
+            return L.marker(latlng, {icon: L.divIcon({
+                html: '<div style="width: 0; height: 0; border-left: 8px solid transparent; ' +
+                      'border-right: 8px solid transparent; border-bottom: 20px solid ' + p.color + '; ' +
+                      'transform: rotate(' + p.bearing + 'deg); transform-origin: 8px 12px;"></div>',
+                iconSize: [16, 16], iconAnchor: [8, 12], className: 'empty'})});
+        }
+    """)
+    _BIND_POPUP = JsCode("""
+        function(feature, layer) {
+            layer.bindPopup(feature.properties.popup, {maxWidth: "100%"});
+        }
+    """)
+
     def __init__(self, df):
         self.df = df
         self.map = None
@@ -248,7 +1275,7 @@ class MapVisualizer:
             unique_laps = [1]  # Default to single lap
         
         # Color mapping (same as used in marker functions)
-        colors = ['blue', 'green', 'red', 'purple', 'orange']
+        colors = LAP_COLORS
         
         # Build legend HTML
         legend_items = []
@@ -270,6 +1297,7 @@ class MapVisualizer:
         # Add the legend to the map
         self.map.get_root().html.add_child(folium.Element(legend_html))
         
+    @instrumented()
     def create_base_map(self):
         # Create basic map with track
         df = self.df
@@ -282,31 +1310,88 @@ class MapVisualizer:
         folium.Marker([df['latitude'].iloc[0], df['longitude'].iloc[0]], popup='Start/End').add_to(m2)
 
         self.map = m2
-    
-    def add_kilometer_markers_directional(self):
-        # Add directional arrows at kilometer points
+
+    def _kilometer_marker_rows(self):
         if self.map is None:
             raise ValueError("Map not created yet. Call create_base_map() first.")
+        if 'is_km_marker' not in self.df.columns:
+            raise ValueError("is_km_marker does not exist make sure to run analyzer.find_kilometer_markers() first")
+        return np.flatnonzero(self.df['is_km_marker'].to_numpy() == 1)
 
-        def calculate_bearing(lat1, lon1, lat2, lon2):
-            """
-            Calculate the bearing (direction) from point 1 to point 2
-            Returns bearing in degrees (0-360)
-            """
-            # Convert to radians
-            lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
-            
-            dlon = lon2 - lon1
-            
-            y = math.sin(dlon) * math.cos(lat2)
-            x = math.cos(lat1) * math.sin(lat2) - math.sin(lat1) * math.cos(lat2) * math.cos(dlon)
-            
-            bearing = math.atan2(y, x)
-            bearing = math.degrees(bearing)
-            bearing = (bearing + 360) % 360  # Convert to 0-360 range
-            
-            return bearing
+    def _kilometer_marker_bearings(self, rows):
+        """
+        Bearing of every km marker towards the point up to 5 rows ahead (fewer near the
+        last markers), NaN for the final marker(s) that get the finish circle
+        """
+        df = self.df
+        look_ahead = np.minimum(5, len(rows) - np.arange(len(rows)) - 1)
+        has_next = (look_ahead > 0) & (rows + look_ahead < len(df))
+        next_rows = np.where(has_next, rows + look_ahead, rows)
+
+        lats = df['latitude'].to_numpy(dtype=float)
+        lons = df['longitude'].to_numpy(dtype=float)
+        bearings = initial_bearings(lats[rows], lons[rows], lats[next_rows], lons[next_rows])
+        return np.where(has_next, bearings, np.nan)
+
+    def _lap_colors(self, rows):
+        laps = self.df['lap'].to_numpy()[rows].astype(int) if 'lap' in self.df.columns else np.ones(len(rows), dtype=int)
+        return np.array(LAP_COLORS)[(laps - 1) % len(LAP_COLORS)]
+
+    def _marker_popups(self, rows, bearings=None):
+        df = self.df
+        popups = [f"KM {int(km)}<br>Distance: {distance:.3f} km<br>Elevation: {elevation:.1f} m"
+                  for km, distance, elevation in zip(df['km_number'].to_numpy()[rows],
+                                                     df['total_distance'].to_numpy()[rows],
+                                                     df['elevation'].to_numpy()[rows])]
+        if bearings is None:
+            return popups
+        return [popup + (f"<br>Bearing: {bearing:.1f}°" if not np.isnan(bearing) else "<br>FINISH")
+                for popup, bearing in zip(popups, bearings)]
 
+    def _add_marker_layer(self, rows, bearings, colors, popups, radius, fill_opacity, weight):
+        """All km markers as one GeoJSON FeatureCollection drawn by the shared pointToLayer"""
+        lats = self.df['latitude'].to_numpy(dtype=float)[rows].tolist()
+        lons = self.df['longitude'].to_numpy(dtype=float)[rows].tolist()
+        features = [{
+            'type': 'Feature',
+            'geometry': {'type': 'Point', 'coordinates': [lon, lat]},
+            'properties': {'bearing': None if np.isnan(bearing) else float(bearing), 'color': color,
+                           'radius': radius, 'fill_opacity': fill_opacity, 'weight': weight, 'popup': popup},
+        } for lat, lon, bearing, color, popup in zip(lats, lons, bearings, colors.tolist(), popups)]
+
+        folium.GeoJson(
+            {'type': 'FeatureCollection', 'features': features},
+            name='Kilometer markers',
+            point_to_layer=self._POINT_TO_LAYER,
+            on_each_feature=self._BIND_POPUP,
+        ).add_to(self.map)
+
+    @instrumented()
+    def add_kilometer_markers_directional(self, render: str = 'geojson'):
+        """
+        Add directional arrows at kilometer points, coloured by lap, with a finish circle on the last marker
+
+        Args:
+            render (str): 'geojson' draws every marker from one GeoJSON layer, 'markers' adds a
+                folium Marker per kilometer (larger HTML, slower for long multi-loop routes)
+        """
+        if render not in MARKER_RENDER_MODES:
+            raise ValueError(f"Unknown render mode '{render}', expected one of {MARKER_RENDER_MODES}")
+        rows = self._kilometer_marker_rows()
+        bearings = self._kilometer_marker_bearings(rows)
+        popups = self._marker_popups(rows, bearings)
+
+        if render == 'geojson':
+            # The finish circle is the only marker not in its lap color
+            colors = np.where(np.isnan(bearings), 'red', self._lap_colors(rows))
+            self._add_marker_layer(rows, bearings, colors, popups, radius=8, fill_opacity=0.8, weight=3)
+        else:
+            self._add_directional_markers(rows, bearings, popups)
+        
+        # Add legend to show lap colors
+        self._add_legend()
+
+    def _add_directional_markers(self, rows, bearings, popups):
         def create_arrow_icon(color, rotation):
             """
             Create a custom HTML/CSS arrow icon for better directional visualization
@@ -326,93 +1411,63 @@ class MapVisualizer:
                 icon_size=(16, 16),
                 icon_anchor=(8, 12)
             )
-        
-        #creating local references
-        combined = self.df
-        m2 = self.map
-        
-        # Add kilometer markers with directional arrows
-        if 'is_km_marker' not in combined.columns:
-            raise ValueError("is_km_marker does not exist make sure to run analyzer.find_kilometer_markers() first")
-        
-        km_marker_rows = combined[combined['is_km_marker'] == 1].copy()
-
-        for i, (index, row) in enumerate(km_marker_rows.iterrows()):
-            # Calculate bearing to next point (look ahead for smoother direction)
-            #take minimum of 5 or remaining markers for bearing calculation
-            look_ahead = min([5, len(km_marker_rows) - i - 1])
-            if look_ahead > 0 and index + look_ahead < len(combined):
-                next_point_idx = index + look_ahead
-                bearing = calculate_bearing(
-                    row['latitude'], row['longitude'],
-                    combined.iloc[next_point_idx]['latitude'], combined.iloc[next_point_idx]['longitude']
-                )
-                
-                # Dynamic color coding based on lap number
-                colors = ['blue', 'green', 'red', 'purple', 'orange']
-                lap_number = row.get('lap', 1)  # Default to 1 if lap column doesn't exist
-                color_index = (lap_number - 1) % len(colors)  # Cycle through colors
-                color = colors[color_index]
-                
-                # Create custom arrow marker
-                arrow_icon = create_arrow_icon(color, bearing)
-                
-                folium.Marker(
-                    location=[row['latitude'], row['longitude']],
-                    icon=arrow_icon,
-                    popup=f"KM {int(row['km_number'])}<br>Distance: {row['total_distance']:.3f} km<br>Elevation: {row['elevation']:.1f} m<br>Bearing: {bearing:.1f}°"
-                ).add_to(m2)
+
+        lats = self.df['latitude'].to_numpy()[rows]
+        lons = self.df['longitude'].to_numpy()[rows]
+        for lat, lon, bearing, color, popup in zip(lats, lons, bearings, self._lap_colors(rows), popups):
+            if not np.isnan(bearing):
+                folium.Marker(location=[lat, lon], icon=create_arrow_icon(color, bearing), popup=popup).add_to(self.map)
             else:
                 # For the last point, use a circle marker since there's no next point
                 folium.CircleMarker(
-                    location=[row['latitude'], row['longitude']],
+                    location=[lat, lon],
                     radius=8,
-                    popup=f"KM {int(row['km_number'])}<br>Distance: {row['total_distance']:.3f} km<br>Elevation: {row['elevation']:.1f} m<br>FINISH",
+                    popup=popup,
                     color='red',
                     fillColor='red',
                     fillOpacity=0.8
-                ).add_to(m2)
-        
-        # Add legend to show lap colors
-        self._add_legend()
+                ).add_to(self.map)
     
-    def add_kilometer_markers(self):
-        # Add simple circle markers at kilometer points (non-directional)
-        if self.map is None:
-            raise ValueError("Map not created yet. Call create_base_map() first.")
-        
-        #creating local references
-        combined = self.df
-        m2 = self.map
-        
-        # Add kilometer markers with simple circles
-        if 'is_km_marker' not in combined.columns:
-            raise ValueError("is_km_marker does not exist make sure to run analyzer.find_kilometer_markers() first")
-        
-        km_marker_rows = combined[combined['is_km_marker'] == 1].copy()
+    @instrumented()
+    def add_kilometer_markers(self, render: str = 'geojson'):
+        """
+        Add simple circle markers at kilometer points (non-directional), coloured by lap
 
-        for i, (index, row) in enumerate(km_marker_rows.iterrows()):
-            # Dynamic color coding based on lap number
-            colors = ['blue', 'green', 'red', 'purple', 'orange']
-            lap_number = row.get('lap', 1)  # Default to 1 if lap column doesn't exist
-            color_index = (lap_number - 1) % len(colors)  # Cycle through colors
-            color = colors[color_index]
-            
-            # Create simple circle marker
-            folium.CircleMarker(
-                location=[row['latitude'], row['longitude']],
-                radius=4,
-                popup=f"KM {int(row['km_number'])}<br>Distance: {row['total_distance']:.3f} km<br>Elevation: {row['elevation']:.1f} m",
-                color=color,
-                fillColor=color,
-                fillOpacity=1.0,
-                weight=2
-            ).add_to(m2)
+        Args:
+            render (str): 'geojson' or 'markers', see add_kilometer_markers_directional
+        """
+        if render not in MARKER_RENDER_MODES:
+            raise ValueError(f"Unknown render mode '{render}', expected one of {MARKER_RENDER_MODES}")
+        rows = self._kilometer_marker_rows()
+        colors = self._lap_colors(rows)
+        popups = self._marker_popups(rows)
+
+        if render == 'geojson':
+            self._add_marker_layer(rows, np.full(len(rows), np.nan), colors, popups,
+                                   radius=4, fill_opacity=1.0, weight=2)
+        else:
+            for lat, lon, color, popup in zip(self.df['latitude'].to_numpy()[rows],
+                                              self.df['longitude'].to_numpy()[rows], colors, popups):
+                folium.CircleMarker(
+                    location=[lat, lon],
+                    radius=4,
+                    popup=popup,
+                    color=color,
+                    fillColor=color,
+                    fillOpacity=1.0,
+                    weight=2
+                ).add_to(self.map)
         
         # Add legend to show lap colors
         self._add_legend()
             
+    @instrumented()
     def save_map(self, filename):
         # Save map to HTML file
         self.map.save(filename)
 
+    @instrumented()
+    def to_html(self):
+        # Full standalone map HTML, the same document save_map writes
+        return self.map.get_root().render()
+
@@ -0,0 +1,237 @@
+#Incremental analysis pipeline
+import copy
+
+import pandas as pd
+
+from pace_planner import GPXAnalyzer, PaceCalculator
+from route_cache import content_hash, route_key, analyzer_to_arrays, analyzer_from_arrays
+from misc_functions import merge_custom_markers, calculate_cutoff_buffers, cutoff_deadlines
+from profiling import profile_stage
+from track_index import waypoint_markers
+
+
+#Usage
+# pipeline = AnalysisPipeline(cache=RouteCache())
+# analyzer = pipeline.run('route.gpx', loops=2, base_pace=6.2, decay=True, hill_mode=True,
+#                         race_start=datetime.time(7, 0))
+# pipeline.stage_status  # {'load': 'reused', ..., 'clock_times': 'recomputed', ...}
+#
+# Each stage is memoized on its own parameters plus everything upstream of it, so changing
+# only race_start reruns clock_times and custom_markers, and changing only base_pace skips
+# parsing, distances and grades.
+
+
+class AnalysisPipeline:
+    # (stage, parameters it reads), in execution order. A stage also depends on every stage before it.
+    STAGES = [
+        ('load', ('source_hash', 'parser')),
+        ('simplify', ('simplify_tolerance',)),
+        ('laps', ('loops',)),
+        ('distances', ('distance_method',)),
+        ('grade', ('grade_mode', 'grade_window')),
+        ('pace', ('base_pace', 'target_time', 'decay', 'hill_mode')),
+        ('clock_times', ('race_start',)),
+        ('custom_markers', ('custom_markers', 'use_km_markers', 'exact_marker_placement', 'gpx_waypoints')),
+        ('cutoff_pacing', ('optimize_cutoffs', 'cutoff_safety_buffer')),
+    ]
+    # Stages whose combined output is stored in the on-disk RouteCache
+    CACHED_THROUGH = 'distances'
+
+    def __init__(self, cache=None, parser: str = 'stream', distance_method: str = 'ellipsoidal'):
+        self.cache = cache
+        self.parser = parser
+        self.distance_method = distance_method
+        self._memo = {}  # stage -> (key, analyzer snapshot)
+        self.stage_status = {}  # stage -> 'reused' | 'cached' | 'recomputed' for the last run
+
+    @property
+    def reused_stages(self):
+        return [stage for stage, status in self.stage_status.items() if status != 'recomputed']
+
+    @property
+    def recomputed_stages(self):
+        return [stage for stage, status in self.stage_status.items() if status == 'recomputed']
+
+    @staticmethod
+    def _frame_key(df):
+        # DataFrames are not hashable, so key them on their content
+        if df is None or len(df) == 0:
+            return None
+        return df.to_json(orient='split', date_format='iso', default_handler=str)
+
+    @staticmethod
+    def _snapshot(analyzer):
+        # Shallow copy: stages replace or add whole columns rather than writing into them,
+        # so later stages never change the arrays held by an earlier snapshot
+        snapshot = copy.copy(analyzer)
+        if analyzer.df is not None:
+            snapshot.df = analyzer.df.copy(deep=False)
+        if analyzer.final_df is not None:
+            snapshot.final_df = analyzer.final_df.copy(deep=False)
+        snapshot.km_markers = dict(analyzer.km_markers)
+        return snapshot
+
+    def _stage_keys(self, params):
+        keys = {}
+        upstream = None
+        for stage, depends_on in self.STAGES:
+            upstream = (stage, tuple(params[name] for name in depends_on), upstream)
+            keys[stage] = upstream
+        return keys
+
+    def run(self, gpx_file_path, loops: int = 1, base_pace: float = 6.0, decay: bool = False,
+            hill_mode: bool = False, race_start=None, custom_markers: pd.DataFrame = None,
+            use_km_markers: bool = True, exact_marker_placement: bool = False,
+            grade_mode: str = 'elevation_change', grade_window: float = None, target_time: float = None,
+            optimize_cutoffs: bool = False, cutoff_safety_buffer: float = 0.0, gpx_waypoints: bool = False,
+            simplify_tolerance: float = None):
+        """
+        Run the analysis, recomputing only the stages whose inputs changed since the last run
+
+        Args:
+            gpx_file_path (str): Path to the GPX file, or its content as bytes/bytearray/memoryview
+            loops (int): Number of loops
+            base_pace (float): Base pace in min/km
+            decay (bool): Apply fatigue decay
+            hill_mode (bool): Apply hill adjustments
+            race_start (datetime.time): Race start time
+            custom_markers (DataFrame): Custom marker table with Distance, Nickname and Cutoff Time
+            use_km_markers (bool): Custom marker distances are in km (True) or miles (False)
+            exact_marker_placement (bool): Place custom markers at their exact distance instead of the nearest km marker
+            grade_mode (str): Grade unit, see PaceCalculator.calculate_grade
+            grade_window (float): Rolling grade window in km, None for per split grades
+            target_time (float): Target finish time in minutes, solves the base pace instead of using base_pace
+            optimize_cutoffs (bool): Replan the paces so every custom marker cutoff is cleared
+            cutoff_safety_buffer (float): Minutes to arrive before each cutoff when optimizing
+            gpx_waypoints (bool): Also add the GPX file's waypoints as markers, snapped to the route
+            simplify_tolerance (float): Simplify the track to this tolerance in metres, None or 0 keeps every point
+
+        Returns:
+            GPXAnalyzer: A fresh copy of the fully analyzed route, safe for the caller to modify
+        """
+        params = {
+            'source_hash': content_hash(gpx_file_path),
+            'parser': self.parser,
+            'simplify_tolerance': simplify_tolerance or None,
+            'loops': loops,
+            'distance_method': self.distance_method,
+            # base_pace is ignored when solving for a target time
+            'base_pace': base_pace if target_time is None else None,
+            'target_time': target_time,
+            'optimize_cutoffs': optimize_cutoffs,
+            'cutoff_safety_buffer': cutoff_safety_buffer,
+            'decay': decay,
+            'hill_mode': hill_mode,
+            'race_start': race_start,
+            'custom_markers': self._frame_key(custom_markers),
+            'use_km_markers': use_km_markers,
+            'exact_marker_placement': exact_marker_placement,
+            'gpx_waypoints': gpx_waypoints,
+            'grade_mode': grade_mode,
+            'grade_window': grade_window,
+        }
+        keys = self._stage_keys(params)
+        stage_names = [stage for stage, _ in self.STAGES]
+
+        # Resume from the deepest stage whose memoized output still matches
+        resume = -1
+        for i, stage in enumerate(stage_names):
+            memo = self._memo.get(stage)
+            if memo is not None and memo[0] == keys[stage]:
+                resume = i
+        self.stage_status = {stage: 'reused' for stage in stage_names[:resume + 1]}
+
+        if resume >= 0:
+            analyzer = self._snapshot(self._memo[stage_names[resume]][1])
+        else:
+            analyzer = GPXAnalyzer(gpx_file_path, parser=self.parser)
+            analyzer.source_hash = params['source_hash']
+
+        # Try the on-disk route cache before parsing and measuring again
+        cached_through = stage_names.index(self.CACHED_THROUGH)
+        disk_key = None
+        if self.cache is not None and resume < cached_through:
+            disk_key = route_key(self.cache, params['source_hash'], loops, self.parser, self.distance_method,
+                                 params['simplify_tolerance'])
+            arrays = self.cache.get(disk_key)
+            if arrays is not None:
+                analyzer_from_arrays(analyzer, arrays)
+                for stage in stage_names[resume + 1:cached_through + 1]:
+                    self.stage_status[stage] = 'cached'
+                self._memo[self.CACHED_THROUGH] = (keys[self.CACHED_THROUGH], self._snapshot(analyzer))
+                resume = cached_through
+                disk_key = None
+
+        # Past the pace stage the snapshot carries the base pace its paces were computed with,
+        # which in target time mode is the solved one, not the form's base_pace
+        if resume >= stage_names.index('pace'):
+            base_pace = analyzer.base_pace
+        pace_calc = PaceCalculator(analyzer, base_pace)
+        for stage in stage_names[resume + 1:]:
+            with profile_stage(f"pipeline.{stage}", status='recomputed') as frame:
+                self._run_stage(stage, analyzer, pace_calc, params, custom_markers)
+                frame['points'] = len(analyzer.final_df if analyzer.final_df is not None else analyzer.df)
+            self._memo[stage] = (keys[stage], self._snapshot(analyzer))
+            self.stage_status[stage] = 'recomputed'
+            if stage == self.CACHED_THROUGH and disk_key is not None:
+                self.cache.put(disk_key, analyzer_to_arrays(analyzer))
+
+        return self._snapshot(analyzer)
+
+    def _run_stage(self, stage, analyzer, pace_calc, params, custom_markers):
+        if stage == 'load':
+            analyzer.load_gpx()
+        elif stage == 'simplify':
+            if params['simplify_tolerance']:
+                analyzer.simplify(params['simplify_tolerance'])
+        elif stage == 'laps':
+            analyzer.map_adjustment(loops=params['loops'])
+        elif stage == 'distances':
+            analyzer.calculate_distances(method=params['distance_method'])
+            analyzer.find_kilometer_markers()
+        elif stage == 'grade':
+            pace_calc.calculate_grade(mode=params['grade_mode'], window_km=params['grade_window'])
+        elif stage == 'pace':
+            if params['target_time'] is not None:
+                pace_calc.solve_base_pace(params['target_time'], decay=params['decay'], hill_mode=params['hill_mode'])
+            pace_calc.apply_pace_model(decay=params['decay'], hill_mode=params['hill_mode'])
+            pace_calc.calculate_times()
+        elif stage == 'clock_times':
+            pace_calc.calculate_clock_times(params['race_start'])
+        elif stage == 'custom_markers':
+            if params['gpx_waypoints']:
+                # Waypoints go first so a typed marker's cutoff wins when both land on one row
+                analyzer.final_df = merge_custom_markers(
+                    analyzer.final_df,
+                    waypoint_markers(analyzer),
+                    use_km_markers=True,
+                    exact_placement=True,
+                    include_start=True
+                )
+            if custom_markers is not None and not custom_markers.empty:
+                analyzer.final_df = merge_custom_markers(
+                    analyzer.final_df,
+                    custom_markers,
+                    use_km_markers=params['use_km_markers'],
+                    exact_placement=params['exact_marker_placement']
+                )
+            self._cutoff_buffers(analyzer)
+        elif stage == 'cutoff_pacing':
+            cutoff_rows, deadlines = cutoff_deadlines(analyzer.final_df, analyzer.race_start_datetime)
+            if params['optimize_cutoffs'] and len(cutoff_rows):
+                pace_calc.optimize_cutoff_pacing(
+                    cutoff_rows,
+                    deadlines,
+                    safety_buffer=params['cutoff_safety_buffer'],
+                    decay=params['decay'],
+                    hill_mode=params['hill_mode']
+                )
+                # Arrival times moved, the deadlines did not
+                pace_calc.calculate_clock_times(params['race_start'])
+                self._cutoff_buffers(analyzer)
+
+    @staticmethod
+    def _cutoff_buffers(analyzer):
+        # Calculate cutoff buffer if cutoff times exist
+        if 'cutoff_time_formatted' in analyzer.final_df.columns:
+            calculate_cutoff_buffers(analyzer.final_df, analyzer.race_start_datetime)
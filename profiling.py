@@ -0,0 +1,171 @@
+#Per-stage timing and memory instrumentation
+import json
+import time
+import datetime
+import functools
+import contextlib
+import contextvars
+import tracemalloc
+
+import pandas as pd
+
+
+#Usage
+# with RunProfile('analysis') as profile:
+#     analyzer.load_gpx()            # methods decorated with @instrumented record themselves
+#     with profile_stage('custom step', points=len(df)):
+#         ...
+# profile.to_dataframe()
+# profile.to_json()
+#
+# Outside of an active RunProfile the hooks do nothing beyond one context lookup.
+
+_active_profile = contextvars.ContextVar('active_profile', default=None)
+
+
+class RunProfile:
+    """
+    Collects one record per instrumented stage: wall time, point count and peak memory
+    (peak traced allocation above the memory in use when the stage started).
+    """
+    def __init__(self, name: str = 'analysis', track_memory: bool = True):
+        self.name = name
+        self.track_memory = track_memory
+        self.records = []
+        self.started_at = None
+        self.total_ms = 0.0
+        self._stack = []
+        self._token = None
+        self._started_tracemalloc = False
+        self._start = None
+
+    def __enter__(self):
+        # a profile can be entered several times, e.g. around separate blocks of one rerun
+        if self.started_at is None:
+            self.started_at = datetime.datetime.now().isoformat(timespec='seconds')
+        if self.track_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        self._token = _active_profile.set(self)
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.total_ms += (time.perf_counter() - self._start) * 1000
+        _active_profile.reset(self._token)
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+        return False
+
+    def _memory_tracked(self):
+        return self.track_memory and tracemalloc.is_tracing()
+
+    @contextlib.contextmanager
+    def stage(self, name, points=None, **extra):
+        """Time one stage, nested stages are recorded with their depth"""
+        frame = {'peak': 0, 'start_memory': 0}
+        if self._memory_tracked():
+            current, peak = tracemalloc.get_traced_memory()
+            if self._stack:
+                # keep the parent's peak before resetting the counter for this stage
+                self._stack[-1]['peak'] = max(self._stack[-1]['peak'], peak)
+            tracemalloc.reset_peak()
+            frame['start_memory'] = current
+        depth = len(self._stack)
+        self._stack.append(frame)
+
+        start = time.perf_counter()
+        try:
+            yield frame
+        finally:
+            wall_ms = (time.perf_counter() - start) * 1000
+            self._stack.pop()
+
+            peak_mb = None
+            if self._memory_tracked():
+                peak = max(frame['peak'], tracemalloc.get_traced_memory()[1])
+                peak_mb = round(max(peak - frame['start_memory'], 0) / (1024 * 1024), 3)
+                if self._stack:
+                    self._stack[-1]['peak'] = max(self._stack[-1]['peak'], peak)
+
+            record = {
+                'stage': name,
+                'depth': depth,
+                'wall_ms': round(wall_ms, 3),
+                'points': frame.get('points', points),
+                'peak_memory_mb': peak_mb,
+            }
+            record.update(extra)
+            self.records.append(record)
+
+    def to_dataframe(self):
+        return pd.DataFrame(self.records, columns=['stage', 'depth', 'wall_ms', 'points', 'peak_memory_mb'] +
+                            sorted({key for record in self.records for key in record} -
+                                   {'stage', 'depth', 'wall_ms', 'points', 'peak_memory_mb'}))
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'started_at': self.started_at,
+            'total_ms': round(self.total_ms, 3),
+            'track_memory': self.track_memory,
+            'stages': self.records,
+        }
+
+    def to_json(self, indent: int = 2):
+        return json.dumps(self.to_dict(), indent=indent, default=str)
+
+
+def active_profile():
+    """The RunProfile currently collecting records, or None"""
+    return _active_profile.get()
+
+
+@contextlib.contextmanager
+def profile_stage(name, points=None, **extra):
+    """Record a stage on the active profile, no-op when nothing is being profiled"""
+    profile = _active_profile.get()
+    if profile is None:
+        yield {}
+        return
+    with profile.stage(name, points=points, **extra) as frame:
+        yield frame
+
+
+def _point_count(obj):
+    # GPXAnalyzer/MapVisualizer hold final_df or df, PaceCalculator holds the analyzer
+    obj = getattr(obj, 'gpx_analyzer', obj)
+    for attr in ('final_df', 'df'):
+        df = getattr(obj, attr, None)
+        if df is not None:
+            return len(df)
+    return None
+
+
+def instrumented(stage_name=None, points=None):
+    """
+    Decorator that records the wrapped function as a stage of the active RunProfile.
+
+    Args:
+        stage_name (str): Name in the profile, defaults to Class.method / function name
+        points (callable): Called with the wrapped function's arguments to get the point count,
+            by default the length of self.final_df / self.df is used for methods
+    """
+    def decorator(func):
+        name = stage_name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            profile = _active_profile.get()
+            if profile is None:
+                return func(*args, **kwargs)
+            with profile.stage(name) as frame:
+                result = func(*args, **kwargs)
+                if points is not None:
+                    frame['points'] = points(*args, **kwargs)
+                elif args:
+                    frame['points'] = _point_count(args[0])
+                return result
+        return wrapper
+    return decorator
@@ -0,0 +1,332 @@
+#Persistent on-disk cache of analyzed routes
+import os
+import json
+import hashlib
+import tempfile
+from xml.parsers import expat
+
+import numpy as np
+import pandas as pd
+
+from pace_planner import GPXAnalyzer, PARSER_VERSION, segment_distances, gpx_buffer
+
+
+#Usage
+# cache = RouteCache()
+# pipeline = AnalysisPipeline(cache=cache)   # pipeline.py stores routes here once distances are done
+#
+# The cache key is the sha256 of the file content plus PARSER_VERSION and the analysis
+# parameters, so editing the file or changing the parser automatically misses the old entry.
+#
+# catalog = RouteCatalog('saved_routes')
+# catalog.refresh()   # only re-parses files whose mtime/size and content hash changed
+# catalog.to_dataframe()
+
+DEFAULT_CACHE_DIR = '.route_cache'
+DEFAULT_CACHE_BYTES = 256 * 1024 * 1024  # 256 MB
+
+
+def content_hash(gpx_file_path, chunk_size: int = 1024 * 1024):
+    """
+    sha256 hex digest of a file's content, read in chunks so large files never sit in memory
+
+    Args:
+        gpx_file_path (str): Path to the GPX file, or its content as bytes/bytearray/memoryview
+        chunk_size (int): Bytes read per chunk
+
+    Returns:
+        str: Hex digest
+    """
+    buffer = gpx_buffer(gpx_file_path)
+    if buffer is not None:
+        return hashlib.sha256(buffer).hexdigest()
+
+    digest = hashlib.sha256()
+    with open(gpx_file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def route_geometry_hash(final_df, columns=('latitude', 'longitude', 'elevation', 'total_distance', 'lap')):
+    """
+    sha256 hex digest of the drawn route: the point coordinates plus the distances the km
+    markers are placed by, so it changes with the file, loops, simplification and distance method
+
+    Args:
+        final_df (pd.DataFrame): Analyzed route
+        columns (tuple): Columns hashed, missing ones are skipped
+
+    Returns:
+        str: Hex digest
+    """
+    digest = hashlib.sha256()
+    for column in columns:
+        if column in final_df.columns:
+            digest.update(column.encode())
+            digest.update(np.ascontiguousarray(final_df[column].to_numpy(dtype=float)))
+    return digest.hexdigest()
+
+
+def write_atomic(path, write, mode='wb'):
+    """
+    Write a file through a uniquely named temp file in the same folder and move it into
+    place, so concurrent writers (Streamlit sessions are threads of one process) never
+    share a temp file and readers never see a half-written one
+
+    Args:
+        path (str): Destination path
+        write (callable): Called with the open temp file to write the content
+        mode (str): File mode, 'wb' or 'w'
+    """
+    with tempfile.NamedTemporaryFile(mode, dir=os.path.dirname(path) or '.',
+                                     prefix=os.path.basename(path) + '.', suffix='.tmp',
+                                     delete=False) as f:
+        tmp_path = f.name
+        try:
+            write(f)
+        except BaseException:
+            f.close()
+            os.remove(tmp_path)
+            raise
+    os.replace(tmp_path, path)
+
+
+class RouteCache:
+    """
+    Size-bounded LRU cache of distance-annotated routes stored as uncompressed .npz files.
+    Each entry holds every column of GPXAnalyzer.final_df after find_kilometer_markers()
+    plus the route level stats (uphill, downhill, track name).
+    """
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_CACHE_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(source_hash, **params):
+        """Build a cache key from the content hash, parser version and analysis parameters"""
+        param_str = '_'.join(f"{name}-{params[name]}" for name in sorted(params))
+        return f"{source_hash}_v{PARSER_VERSION}_{param_str}"
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.npz")
+
+    def get(self, key):
+        """
+        Load a cached entry, returns None on a miss or if the entry is stale/corrupt.
+        A hit refreshes the entry's mtime, which is what LRU eviction orders on.
+        """
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                entry = {name: data[name] for name in data.files}
+        except (OSError, ValueError):
+            self._remove(path)
+            return None
+
+        if int(entry.get('__parser_version__', -1)) != PARSER_VERSION:
+            self._remove(path)
+            return None
+
+        os.utime(path)
+        return entry
+
+    def put(self, key, arrays):
+        """Write an entry atomically then evict least recently used entries over max_bytes"""
+        path = self._path(key)
+        write_atomic(path, lambda f: np.savez(f, __parser_version__=np.array(PARSER_VERSION), **arrays))
+        self.evict()
+
+    def evict(self):
+        """Delete the least recently used entries until the cache fits in max_bytes"""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.npz'):
+                path = os.path.join(self.cache_dir, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    def clear(self):
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.npz'):
+                self._remove(os.path.join(self.cache_dir, name))
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def analyzer_to_arrays(analyzer):
+    """Flatten an analyzed route into the named arrays stored in a cache entry"""
+    arrays = {f"col_{col}": analyzer.final_df[col].to_numpy() for col in analyzer.final_df.columns}
+    arrays['__columns__'] = np.array(analyzer.final_df.columns, dtype=str)
+    arrays['__uphill_downhill__'] = np.array([analyzer.uphill, analyzer.downhill], dtype=float)
+    arrays['__track_name__'] = np.array(analyzer.track_name or '', dtype=str)
+    arrays['__waypoint_names__'] = analyzer.waypoints['name'].fillna('').to_numpy(dtype=str)
+    arrays['__waypoint_coords__'] = analyzer.waypoints[['latitude', 'longitude']].to_numpy(dtype=float).reshape(-1, 2)
+    arrays['__simplification__'] = np.array(json.dumps(analyzer.simplification), dtype=str)
+    return arrays
+
+
+def analyzer_from_arrays(analyzer, arrays):
+    """Restore final_df and the route stats of a cache entry onto an analyzer"""
+    columns = [str(col) for col in arrays['__columns__']]
+    analyzer.final_df = pd.DataFrame({col: arrays[f"col_{col}"] for col in columns})
+    analyzer.uphill, analyzer.downhill = (float(x) for x in arrays['__uphill_downhill__'])
+    analyzer.track_name = str(arrays['__track_name__']) or None
+    coords = arrays['__waypoint_coords__']
+    analyzer.waypoints = pd.DataFrame({'name': arrays['__waypoint_names__'].astype(str),
+                                       'latitude': coords[:, 0], 'longitude': coords[:, 1]})
+    if '__simplification__' in arrays:
+        analyzer.simplification = json.loads(str(arrays['__simplification__']))
+
+    # Rebuild the single lap frame that map_adjustment works from
+    lap_column = 'lap' if 'lap' in analyzer.final_df.columns else 'loop'
+    first_lap = analyzer.final_df[analyzer.final_df[lap_column] == 1]
+    analyzer.df = first_lap[['latitude', 'longitude', 'elevation']].reset_index(drop=True)
+    analyzer.lap_size = len(analyzer.df)
+    analyzer.loops = int(analyzer.final_df[lap_column].max()) if len(analyzer.final_df) else 1
+
+    km_rows = analyzer.final_df[analyzer.final_df['is_km_marker'] == 1]
+    analyzer.km_markers = dict(zip(km_rows['km_number'].astype(int), km_rows.index))
+    return analyzer
+
+
+def route_key(cache, source_hash, loops, parser, distance_method, simplify_tolerance=None):
+    """Cache key of a route analyzed up to find_kilometer_markers"""
+    params = {'loops': loops, 'parser': parser, 'distance': distance_method}
+    if simplify_tolerance:
+        # unsimplified routes keep the keys they had before simplification existed
+        params['simplify'] = simplify_tolerance
+    return cache.make_key(source_hash, **params)
+
+
+def route_metadata(gpx_file_path):
+    """
+    Summary stats for one GPX file, computed with the streaming parser
+
+    Args:
+        gpx_file_path (str): Path to the GPX file
+
+    Returns:
+        dict: point_count, total_distance (km), elevation_gain/elevation_loss (m),
+            bbox [min_lat, min_lon, max_lat, max_lon], start/finish [lat, lon] and track_name
+    """
+    analyzer = GPXAnalyzer(gpx_file_path, parser='stream')
+    analyzer.load_gpx()
+    lats = analyzer.df['latitude'].to_numpy()
+    lons = analyzer.df['longitude'].to_numpy()
+
+    if len(lats) == 0:
+        return {'point_count': 0, 'total_distance': 0.0, 'elevation_gain': 0.0, 'elevation_loss': 0.0,
+                'bbox': None, 'start': None, 'finish': None, 'track_name': analyzer.track_name}
+
+    return {
+        'point_count': int(len(lats)),
+        'total_distance': float(segment_distances(lats, lons).sum()),
+        'elevation_gain': float(analyzer.uphill),
+        'elevation_loss': float(analyzer.downhill),
+        'bbox': [float(lats.min()), float(lons.min()), float(lats.max()), float(lons.max())],
+        'start': [float(lats[0]), float(lons[0])],
+        'finish': [float(lats[-1]), float(lons[-1])],
+        'track_name': analyzer.track_name,
+    }
+
+
+class RouteCatalog:
+    """
+    JSON index of the GPX files in a folder with precomputed route metadata.
+    refresh() only stats the files and re-parses the ones whose mtime/size changed
+    and whose content hash no longer matches, so opening the app stays cheap as the
+    library grows. A file that can not be parsed gets an entry with only an error
+    message, so one broken file never hides the rest of the library.
+    """
+    def __init__(self, routes_dir: str = 'saved_routes', index_path: str = None):
+        self.routes_dir = routes_dir
+        self.index_path = index_path or os.path.join(DEFAULT_CACHE_DIR, 'catalog.json')
+        self.entries = {}
+        self._load_index()
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, 'r') as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return
+        if index.get('parser_version') == PARSER_VERSION and index.get('routes_dir') == self.routes_dir:
+            self.entries = index.get('entries', {})
+
+    def _save_index(self):
+        os.makedirs(os.path.dirname(self.index_path) or '.', exist_ok=True)
+        index = {'parser_version': PARSER_VERSION, 'routes_dir': self.routes_dir, 'entries': dict(self.entries)}
+        write_atomic(self.index_path, lambda f: json.dump(index, f), mode='w')
+
+    def refresh(self):
+        """
+        Bring the index up to date with the routes folder
+
+        Returns:
+            bool: True if any entry was added, updated or removed
+        """
+        if not os.path.isdir(self.routes_dir):
+            changed = bool(self.entries)
+            self.entries = {}
+            return changed
+
+        changed = False
+        seen = set()
+        for file_name in os.listdir(self.routes_dir):
+            if not file_name.endswith('.gpx'):
+                continue
+            seen.add(file_name)
+            path = os.path.join(self.routes_dir, file_name)
+            stat = os.stat(path)
+            entry = self.entries.get(file_name)
+
+            if entry and entry['mtime_ns'] == stat.st_mtime_ns and entry['size'] == stat.st_size:
+                continue
+
+            file_hash = content_hash(path)
+            if entry and entry['hash'] == file_hash:
+                # touched but unchanged, no need to parse again
+                entry['mtime_ns'], entry['size'] = stat.st_mtime_ns, stat.st_size
+            else:
+                entry = {'hash': file_hash, 'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+                try:
+                    entry.update(route_metadata(path))
+                except (expat.ExpatError, ValueError) as e:
+                    entry['error'] = str(e)
+                self.entries[file_name] = entry
+            changed = True
+
+        for file_name in set(self.entries) - seen:
+            del self.entries[file_name]
+            changed = True
+
+        if changed:
+            self._save_index()
+        return changed
+
+    def to_dataframe(self):
+        """Catalog as a DataFrame with one row per route, sorted by file name, error is set on unreadable files"""
+        columns = ['file_name', 'track_name', 'point_count', 'total_distance', 'elevation_gain',
+                   'elevation_loss', 'bbox', 'start', 'finish', 'hash', 'error']
+        rows = [{'file_name': name, **entry} for name, entry in self.entries.items()]
+        catalog_df = pd.DataFrame(rows, columns=columns)
+        return catalog_df.sort_values('file_name', key=lambda s: s.str.lower()).reset_index(drop=True)
@@ -0,0 +1,138 @@
+#Monte Carlo finish time and cutoff risk simulation
+import concurrent.futures
+
+import numpy as np
+import pandas as pd
+
+from pace_planner import format_duration
+from misc_functions import cutoff_deadlines
+from profiling import instrumented
+
+
+#Usage
+# analyzer = pipeline.run(...)   # paces, times and custom markers with cutoffs computed
+# result = simulate_race(analyzer, draws=10000, split_noise=0.08, fatigue_sd=0.1)
+# result['finish_percentiles']   # finish time at each percentile
+# result['markers']              # one row per cutoff marker with its miss probability
+#
+# Every draw scales the planned split times by independent per-split noise and by a
+# per-draw fatigue factor that grows with distance, so one draw can be a strong day
+# or a slow second half. Draws run in batches of (draws, splits) arrays, optionally
+# spread over a process pool. Each batch gets its own seed from one SeedSequence, so
+# the result for a given seed does not depend on the number of workers.
+
+DEFAULT_PERCENTILES = (5, 10, 25, 50, 75, 90, 95)
+
+
+def simulate_split_times(split_minutes, progress, draws, split_noise, fatigue_sd, rng):
+    """
+    Sample perturbed split times
+
+    Args:
+        split_minutes (np.ndarray): Planned minutes per split
+        progress (np.ndarray): Fraction of the race completed at the end of each split
+        draws (int): Number of draws
+        split_noise (float): Standard deviation of the per-split log pace noise
+        fatigue_sd (float): Standard deviation of the per-draw log fatigue at the finish
+        rng (np.random.Generator): Random generator
+
+    Returns:
+        np.ndarray: Minutes per split, shape (draws, splits)
+    """
+    # mean one lognormal noise and fatigue, so the average draw follows the plan
+    noise = np.exp(split_noise * rng.standard_normal((draws, len(split_minutes))) - split_noise ** 2 / 2)
+    fatigue = np.exp(fatigue_sd * rng.standard_normal((draws, 1)) * progress - (fatigue_sd * progress) ** 2 / 2)
+    return split_minutes * noise * fatigue
+
+
+def _simulate_batch(task):
+    # Module level so it can be sent to a process pool
+    split_minutes, progress, marker_splits, draws, split_noise, fatigue_sd, seed = task
+    rng = np.random.default_rng(seed)
+    elapsed = np.cumsum(simulate_split_times(split_minutes, progress, draws, split_noise, fatigue_sd, rng), axis=1)
+    return elapsed[:, -1], elapsed[:, marker_splits]
+
+
+@instrumented(points=lambda analyzer, *args, **kwargs: len(analyzer.final_df))
+def simulate_race(analyzer, draws: int = 10000, split_noise: float = 0.08, fatigue_sd: float = 0.1,
+                  batch_size: int = 2500, workers: int = None, seed: int = None,
+                  percentiles=DEFAULT_PERCENTILES):
+    """
+    Monte Carlo simulation of finish time and cutoff misses around the planned paces
+
+    Args:
+        analyzer (GPXAnalyzer): Analyzed route with segment_time/cumulative_time, clock times
+            and cutoff_time_formatted on cutoff markers
+        draws (int): Number of simulated races
+        split_noise (float): Per-split pace variability, 0.08 is roughly +/-8% per split
+        fatigue_sd (float): Per-race fatigue variability reached at the finish
+        batch_size (int): Draws simulated per vectorized batch
+        workers (int): Spread batches over this many processes, None or 1 runs in-process
+        seed (int): Seed for reproducible results
+        percentiles (tuple): Finish time percentiles to report
+
+    Returns:
+        dict: 'finish_percentiles' (DataFrame: percentile, finish_minutes, finish_time),
+            'markers' (DataFrame: one row per cutoff marker with planned and simulated arrival
+            and miss_probability), 'finish_minutes' (np.ndarray of every draw), 'planned_finish' (float)
+    """
+    if draws <= 0 or batch_size <= 0:
+        raise ValueError("draws and batch_size must be positive")
+    if split_noise < 0 or fatigue_sd < 0:
+        raise ValueError("split_noise and fatigue_sd must not be negative")
+
+    df = analyzer.final_df
+    segment_time = np.nan_to_num(df['segment_time'].to_numpy(dtype=float))
+    cumulative_time = df['cumulative_time'].to_numpy(dtype=float)
+    total_distance = df['total_distance'].to_numpy(dtype=float)
+
+    # Splits end at every km marker, every cutoff marker and the finish
+    marker_rows, deadlines = cutoff_deadlines(df, analyzer.race_start_datetime)
+    km_rows = np.flatnonzero(df['is_km_marker'].to_numpy() == 1)
+    ends = np.unique(np.concatenate((km_rows, marker_rows, [len(df) - 1])))
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    split_minutes = np.add.reduceat(segment_time, starts)
+    progress = total_distance[ends] / total_distance[-1] if total_distance[-1] > 0 else np.ones(len(ends))
+    marker_splits = np.searchsorted(ends, marker_rows)
+
+    batch_sizes = [min(batch_size, draws - first) for first in range(0, draws, batch_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(batch_sizes))
+    tasks = [(split_minutes, progress, marker_splits, size, split_noise, fatigue_sd, batch_seed)
+             for size, batch_seed in zip(batch_sizes, seeds)]
+
+    if workers and workers > 1 and len(tasks) > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_simulate_batch, tasks))
+    else:
+        results = [_simulate_batch(task) for task in tasks]
+
+    finish_minutes = np.concatenate([finish for finish, _ in results])
+    marker_minutes = np.concatenate([markers for _, markers in results], axis=0)
+
+    finish_at = np.percentile(finish_minutes, percentiles)
+    finish_percentiles = pd.DataFrame({
+        'percentile': list(percentiles),
+        'finish_minutes': finish_at,
+        'finish_time': format_duration(finish_at),
+    })
+
+    def marker_column(name):
+        return df[name].to_numpy()[marker_rows] if name in df.columns else np.full(len(marker_rows), None)
+
+    marker_table = pd.DataFrame({
+        'custom_marker': marker_column('custom_marker'),
+        'total_distance': total_distance[marker_rows],
+        'cutoff_time_formatted': marker_column('cutoff_time_formatted'),
+        'planned_minutes': cumulative_time[marker_rows],
+        'deadline_minutes': deadlines,
+        'median_minutes': np.median(marker_minutes, axis=0),
+        'p90_minutes': np.percentile(marker_minutes, 90, axis=0),
+        'miss_probability': (marker_minutes > deadlines).mean(axis=0),
+    })
+
+    return {
+        'finish_percentiles': finish_percentiles,
+        'markers': marker_table,
+        'finish_minutes': finish_minutes,
+        'planned_finish': float(cumulative_time[-1]),
+    }
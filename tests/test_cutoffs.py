@@ -0,0 +1,55 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+
+from misc_functions import cutoff_deadlines, calculate_cutoff_buffers
+from pace_planner import cutoff_pacing
+
+
+def marker_df(distances, cumulative_times, cutoffs):
+    """Route table with one row per distance, cutoffs given as {row: 'HH:MM'}"""
+    df = pd.DataFrame({'total_distance': distances, 'cumulative_time': cumulative_times})
+    df['cutoff_time_formatted'] = pd.Series([pd.NA] * len(df), dtype=object)
+    for row, clock in cutoffs.items():
+        df.at[row, 'cutoff_time_formatted'] = datetime.datetime.strptime(clock, "%H:%M").time()
+    return df
+
+
+def test_cutoff_at_start_clock_time_is_a_full_day_later():
+    df = marker_df([0.0, 40.0, 80.0], [0.0, 360.0, 768.0], {2: '06:00'})
+    rows, deadlines = cutoff_deadlines(df, datetime.datetime(2026, 6, 1, 6, 0))
+    np.testing.assert_array_equal(rows, [2])
+    np.testing.assert_allclose(deadlines, [1440.0])
+    calculate_cutoff_buffers(df, datetime.datetime(2026, 6, 1, 6, 0))
+    assert df['cutoff_buffer_minutes'].iloc[2] == 672.0
+
+
+def test_equal_clock_times_stay_on_the_same_day():
+    df = marker_df([0.0, 60.0, 120.0], [0.0, 400.0, 470.0], {1: '14:00', 2: '14:00'})
+    _, deadlines = cutoff_deadlines(df, datetime.datetime(2026, 6, 1, 6, 0))
+    np.testing.assert_allclose(deadlines, [480.0, 480.0])
+
+
+def test_earlier_clock_time_is_next_day_when_the_race_runs_past_midnight():
+    df = marker_df([0.0, 80.0, 120.0, 160.0], [0.0, 900.0, 1300.0, 1800.0], {1: '22:00', 2: '05:00', 3: '13:00'})
+    rows, deadlines = cutoff_deadlines(df, datetime.datetime(2026, 6, 1, 6, 0))
+    np.testing.assert_allclose(deadlines, [960.0, 1380.0, 1860.0])
+    calculate_cutoff_buffers(df, datetime.datetime(2026, 6, 1, 6, 0))
+    assert not df['cutoff_out_of_order'].any()
+
+
+def test_out_of_order_cutoff_on_a_same_day_race_is_flagged_not_moved():
+    df = marker_df([0.0, 10.0, 12.0, 42.2], [0.0, 50.0, 30.8, 300.0], {1: '07:15', 2: '07:00', 3: '11:00'})
+    calculate_cutoff_buffers(df, datetime.datetime(2026, 6, 1, 6, 0))
+    np.testing.assert_allclose(df['cutoff_buffer_minutes'].iloc[1:], [25.0, 29.2, 0.0])
+    assert df['cutoff_out_of_order'].tolist() == [False, False, True, False]
+
+
+def test_cutoff_pacing_reaches_a_cutoff_at_start_clock_time():
+    distance = np.linspace(0.0, 80.0, 81)
+    segment = np.diff(distance, prepend=0.0)
+    df = marker_df(distance, np.zeros(len(distance)), {80: '06:00'})
+    rows, deadlines = cutoff_deadlines(df, datetime.datetime(2026, 6, 1, 6, 0))
+    base = cutoff_pacing(segment, distance, np.zeros(len(distance)), 80.0, 9.6, rows, deadlines)
+    assert np.sum(base * segment) <= deadlines[0] + 1e-9
@@ -0,0 +1,46 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from pace_planner import speed_calculation, speed_calculation_array
+
+
+TOTAL_DISTANCE = 42.2
+DISTANCES = np.array([0.0, 0.5, 10.0, 21.1, 21.1, 21.2, 30.0, 42.2, 42.2, 5.0, 35.0, 41.0, 2.0, 40.0])
+# NaN, flat, downhill, the moderate band edges, the >= 20 % band and grades that hit the 12.5 cap
+GRADES = np.array([np.nan, 0.0, -5.0, 0.1, 8.0, 19.99, 20.0, 20.0, 35.0, 60.0, 25.0, np.nan, -30.0, 45.0])
+
+
+def scalar_reference(base_pace, decay, hill_mode):
+    paces = []
+    for distance, grade in zip(DISTANCES, GRADES):
+        # speed_calculation compares NaN grades as False, so they get no hill adjustment
+        paces.append(speed_calculation(base_pace, distance, grade, TOTAL_DISTANCE, decay=decay, hill_mode=hill_mode))
+    return np.array(paces)
+
+
+@pytest.mark.parametrize('decay, hill_mode', list(itertools.product([False, True], repeat=2)))
+@pytest.mark.parametrize('base_pace', [4.0, 6.5, 11.0])
+def test_array_matches_scalar(base_pace, decay, hill_mode):
+    expected = scalar_reference(base_pace, decay, hill_mode)
+    actual = speed_calculation_array(base_pace, DISTANCES, GRADES, TOTAL_DISTANCE, decay=decay, hill_mode=hill_mode)
+    np.testing.assert_allclose(actual, expected, rtol=0, atol=1e-12)
+
+
+@pytest.mark.parametrize('decay, hill_mode', list(itertools.product([False, True], repeat=2)))
+def test_column_of_base_paces_broadcasts(decay, hill_mode):
+    base_paces = np.array([[4.0], [6.5], [11.0]])
+    actual = speed_calculation_array(base_paces, DISTANCES, GRADES, TOTAL_DISTANCE, decay=decay, hill_mode=hill_mode)
+    assert actual.shape == (3, len(DISTANCES))
+    for row, base_pace in zip(actual, base_paces[:, 0]):
+        np.testing.assert_allclose(row, scalar_reference(base_pace, decay, hill_mode), rtol=0, atol=1e-12)
+
+
+def test_steep_grades_are_capped():
+    paces = speed_calculation_array(6.5, DISTANCES, GRADES, TOTAL_DISTANCE, decay=True, hill_mode=True)
+    steep = GRADES >= 20
+    assert np.all(paces[steep] <= 12.5)
+    assert np.any(paces[steep] == 12.5)
+    nan_grade = np.isnan(GRADES)
+    np.testing.assert_allclose(paces[nan_grade], speed_calculation_array(6.5, DISTANCES, 0.0, TOTAL_DISTANCE, decay=True)[nan_grade])
@@ -0,0 +1,35 @@
+import datetime
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from pipeline import AnalysisPipeline
+
+
+ROUTE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'saved_routes', 'tokyo_marathon.gpx')
+CUTOFFS = pd.DataFrame({'Distance': [15.0, 30.0], 'Nickname': ['Gate 1', 'Gate 2'], 'Cutoff Time': ['12:00', '16:30']})
+
+
+def run(pipeline, **params):
+    settings = dict(loops=1, race_start=datetime.time(7, 0), custom_markers=CUTOFFS, target_time=600.0,
+                    decay=True, hill_mode=True, optimize_cutoffs=False, cutoff_safety_buffer=0.0)
+    settings.update(params)
+    return pipeline.run(ROUTE, **settings)
+
+
+@pytest.mark.parametrize('changed', [
+    {'optimize_cutoffs': True},
+    {'optimize_cutoffs': True, 'cutoff_safety_buffer': 10.0},
+])
+def test_target_time_resume_matches_fresh_run(changed):
+    pipeline = AnalysisPipeline()
+    run(pipeline)
+    resumed = run(pipeline, **changed)
+    assert 'pace' in pipeline.reused_stages
+
+    fresh = run(AnalysisPipeline(), **changed)
+    assert resumed.base_pace == pytest.approx(fresh.base_pace)
+    np.testing.assert_allclose(resumed.final_df['cumulative_time'], fresh.final_df['cumulative_time'])
+    assert fresh.final_df['cumulative_time'].iloc[-1] == pytest.approx(600.0, abs=0.01)
@@ -0,0 +1,28 @@
+import os
+import shutil
+
+import pandas as pd
+
+from route_cache import RouteCatalog
+
+
+ROUTES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'saved_routes')
+
+
+def test_truncated_gpx_does_not_break_refresh(tmp_path):
+    routes = tmp_path / 'routes'
+    routes.mkdir()
+    shutil.copy(os.path.join(ROUTES_DIR, 'tokyo_marathon.gpx'), routes / 'tokyo_marathon.gpx')
+    with open(os.path.join(ROUTES_DIR, 'tokyo_marathon.gpx'), 'rb') as f:
+        (routes / 'truncated.gpx').write_bytes(f.read(3000))
+
+    catalog = RouteCatalog(str(routes), index_path=str(tmp_path / 'catalog.json'))
+    assert catalog.refresh()
+
+    catalog_df = catalog.to_dataframe().set_index('file_name')
+    assert catalog_df.loc['tokyo_marathon.gpx', 'point_count'] > 0
+    assert pd.isna(catalog_df.loc['tokyo_marathon.gpx', 'error'])
+    assert catalog_df.loc['truncated.gpx', 'error']
+
+    # the broken entry is remembered, not parsed again on every refresh
+    assert not RouteCatalog(str(routes), index_path=str(tmp_path / 'catalog.json')).refresh()
@@ -0,0 +1,11 @@
+import numpy as np
+
+from simulation import simulate_split_times
+
+
+def test_average_draw_follows_the_plan():
+    split_minutes = np.full(42, 6.0)
+    progress = np.arange(1, 43) / 42
+    splits = simulate_split_times(split_minutes, progress, 200000, 0.08, 0.3, np.random.default_rng(0))
+    np.testing.assert_allclose(splits.mean(axis=0), split_minutes, rtol=0.01)
+    np.testing.assert_allclose(splits.sum(axis=1).mean(), split_minutes.sum(), rtol=0.002)
@@ -0,0 +1,32 @@
+import os
+
+import pytest
+
+from pace_planner import GPXAnalyzer, SPLIT_INTERVALS
+
+
+ROUTE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'saved_routes', 'tokyo_marathon.gpx')
+
+
+@pytest.fixture(scope='module')
+def analyzer():
+    analyzer = GPXAnalyzer(ROUTE)
+    analyzer.load_gpx()
+    analyzer.map_adjustment(loops=1)
+    analyzer.calculate_distances()
+    return analyzer
+
+
+@pytest.mark.parametrize('name', list(SPLIT_INTERVALS))
+def test_named_interval_matches_its_length(analyzer, name):
+    assert analyzer.find_split_markers(interval=name) == analyzer.find_split_markers(interval=SPLIT_INTERVALS[name])
+
+
+def test_unknown_interval_name_raises(analyzer):
+    with pytest.raises(ValueError, match="'10k'.*'km', 'mile', '5km'"):
+        analyzer.find_split_markers(interval='10k')
+
+
+def test_non_positive_interval_raises(analyzer):
+    with pytest.raises(ValueError):
+        analyzer.find_split_markers(interval=0)
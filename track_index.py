@@ -0,0 +1,196 @@
+#Spatial grid index over trackpoints for snapping waypoints to the route
+import numpy as np
+import pandas as pd
+
+from pace_planner import EARTH_MEAN_RADIUS
+
+
+#Usage
+# index = TrackIndex.from_analyzer(analyzer)          # after calculate_distances()
+# passes = index.snap(lats, lons, max_distance_m=50)  # one row per time the route passes each waypoint
+# markers = waypoint_markers(analyzer)                # the GPX <wpt> elements as custom markers
+# analyzer.final_df = merge_custom_markers(analyzer.final_df, markers, exact_placement=True)
+#
+# Points are projected to local metres and bucketed in square grid cells sorted by cell key,
+# so a batch of waypoints is answered with one searchsorted over the occupied cells and a
+# ragged gather of the points in the neighbouring cells, no Python loop per waypoint.
+
+
+class TrackIndex:
+    """
+    Uniform grid over the route's trackpoints (equirectangular projection around the
+    route's mean latitude, accurate to well under a metre at snapping distances).
+    """
+    def __init__(self, latitudes, longitudes, total_distance, cell_size_m: float = 50.0):
+        if cell_size_m <= 0:
+            raise ValueError("cell_size_m must be positive")
+        self.latitudes = np.asarray(latitudes, dtype=float)
+        self.longitudes = np.asarray(longitudes, dtype=float)
+        self.total_distance = np.asarray(total_distance, dtype=float)
+        self.cell_size_m = cell_size_m
+
+        self._lat0 = np.radians(np.nanmean(self.latitudes)) if len(self.latitudes) else 0.0
+        self.x, self.y = self._project(self.latitudes, self.longitudes)
+
+        cx, cy = self._cells(self.x, self.y)
+        self._origin = (cx.min(), cy.min()) if len(cx) else (0, 0)
+        self._span = int(cy.max() - self._origin[1]) + 3 if len(cy) else 3
+        keys = self._keys(cx, cy)
+
+        # points grouped by cell, each occupied cell is a run in self._order
+        self._order = np.argsort(keys, kind='stable')
+        self._cell_keys, self._cell_starts, self._cell_counts = np.unique(
+            keys[self._order], return_index=True, return_counts=True)
+
+    @classmethod
+    def from_analyzer(cls, analyzer, cell_size_m: float = 50.0):
+        """Index every row of final_df, all laps included"""
+        df = analyzer.final_df
+        return cls(df['latitude'].to_numpy(), df['longitude'].to_numpy(), df['total_distance'].to_numpy(),
+                   cell_size_m=cell_size_m)
+
+    def _project(self, latitudes, longitudes):
+        # metres east/north on a local equirectangular plane
+        x = EARTH_MEAN_RADIUS * 1000 * np.radians(longitudes) * np.cos(self._lat0)
+        y = EARTH_MEAN_RADIUS * 1000 * np.radians(latitudes)
+        return x, y
+
+    def _cells(self, x, y):
+        return np.floor(x / self.cell_size_m).astype(np.int64), np.floor(y / self.cell_size_m).astype(np.int64)
+
+    def _keys(self, cx, cy):
+        return (cx - self._origin[0]) * self._span + (cy - self._origin[1])
+
+    def _candidates(self, qx, qy, radius_cells):
+        """(query id, point row) pairs for every point in the cells around each query"""
+        cx, cy = self._cells(qx, qy)
+        offsets = np.arange(-radius_cells, radius_cells + 1)
+        dx, dy = np.meshgrid(offsets, offsets, indexing='ij')
+        ncx = cx[:, None] + dx.ravel()[None, :]
+        ncy = cy[:, None] + dy.ravel()[None, :]
+
+        # cells outside the indexed area can alias other keys, so drop them first
+        inside = (ncy - self._origin[1] >= 0) & (ncy - self._origin[1] < self._span)
+        keys = self._keys(ncx, ncy)
+        slot = np.clip(np.searchsorted(self._cell_keys, keys), 0, len(self._cell_keys) - 1)
+        found = inside & (self._cell_keys[slot] == keys)
+
+        query_ids = np.broadcast_to(np.arange(len(qx))[:, None], keys.shape)[found]
+        starts = self._cell_starts[slot[found]]
+        counts = self._cell_counts[slot[found]]
+
+        # ragged arange: every position of every found cell's run
+        total = counts.sum()
+        run_offsets = np.repeat(np.cumsum(counts) - counts, counts)
+        positions = np.arange(total) - run_offsets + np.repeat(starts, counts)
+        return np.repeat(query_ids, counts), self._order[positions]
+
+    def snap(self, latitudes, longitudes, max_distance_m: float = 50.0, pass_gap_km: float = 0.5):
+        """
+        Snap waypoints to the route, once for every pass of the route near each waypoint
+        (out-and-back sections and every lap give separate passes).
+
+        Args:
+            latitudes (array-like): Waypoint latitudes
+            longitudes (array-like): Waypoint longitudes
+            max_distance_m (float): Waypoints further than this from the route are not snapped
+            pass_gap_km (float): Route distance between nearby points that starts a new pass
+
+        Returns:
+            DataFrame: waypoint (position in the input), pass_number (1, 2, ... in route order),
+                row (nearest trackpoint), total_distance (km along the route at the snapped
+                position) and offset_m (distance from the waypoint to the route)
+        """
+        columns = ['waypoint', 'pass_number', 'row', 'total_distance', 'offset_m']
+        qx, qy = self._project(np.asarray(latitudes, dtype=float), np.asarray(longitudes, dtype=float))
+        if len(qx) == 0 or len(self.x) == 0:
+            return pd.DataFrame(columns=columns)
+
+        radius_cells = int(np.ceil(max_distance_m / self.cell_size_m))
+        query, rows = self._candidates(qx, qy, radius_cells)
+        distance = np.hypot(self.x[rows] - qx[query], self.y[rows] - qy[query])
+        near = distance <= max_distance_m
+        query, rows, distance = query[near], rows[near], distance[near]
+        if len(rows) == 0:
+            return pd.DataFrame(columns=columns)
+
+        # walk each waypoint's nearby points in route order, a jump in distance starts a new pass
+        order = np.argsort(query * len(self.x) + rows)
+        query, rows, distance = query[order], rows[order], distance[order]
+        new_pass = np.ones(len(rows), dtype=bool)
+        new_pass[1:] = (query[1:] != query[:-1]) | \
+            (self.total_distance[rows[1:]] - self.total_distance[rows[:-1]] > pass_gap_km)
+
+        # closest point of every pass, the earliest one on ties
+        pass_id = np.cumsum(new_pass) - 1
+        best = np.flatnonzero(distance == np.minimum.reduceat(distance, np.flatnonzero(new_pass))[pass_id])
+        best = best[np.unique(pass_id[best], return_index=True)[1]]
+        query, rows = query[best], rows[best]
+
+        along, offset = self._refine(rows, qx[query], qy[query])
+        pass_starts = np.flatnonzero(np.r_[True, query[1:] != query[:-1]])
+        pass_number = np.arange(len(query)) - np.repeat(pass_starts, np.diff(np.r_[pass_starts, len(query)])) + 1
+        return pd.DataFrame({
+            'waypoint': query,
+            'pass_number': pass_number,
+            'row': rows,
+            'total_distance': along,
+            'offset_m': offset,
+        }, columns=columns)
+
+    def _refine(self, rows, qx, qy):
+        """Project onto the segments before and after the nearest point for the distance along the route"""
+        best_along = self.total_distance[rows].copy()
+        best_offset = np.hypot(self.x[rows] - qx, self.y[rows] - qy)
+        last = len(self.x) - 1
+        for start, end in ((np.maximum(rows - 1, 0), rows), (rows, np.minimum(rows + 1, last))):
+            sx, sy = self.x[end] - self.x[start], self.y[end] - self.y[start]
+            length2 = sx ** 2 + sy ** 2
+            with np.errstate(divide='ignore', invalid='ignore'):
+                t = np.clip(((qx - self.x[start]) * sx + (qy - self.y[start]) * sy) / length2, 0, 1)
+            t = np.where(length2 > 0, t, 0.0)
+            offset = np.hypot(self.x[start] + t * sx - qx, self.y[start] + t * sy - qy)
+            along = self.total_distance[start] + t * (self.total_distance[end] - self.total_distance[start])
+            closer = offset < best_offset
+            best_along = np.where(closer, along, best_along)
+            best_offset = np.where(closer, offset, best_offset)
+        return best_along, best_offset
+
+
+def waypoint_markers(analyzer, waypoints: pd.DataFrame = None, max_distance_m: float = 50.0,
+                     index: TrackIndex = None):
+    """
+    Custom marker table for merge_custom_markers from waypoints snapped to the route
+
+    Args:
+        analyzer (GPXAnalyzer): Analyzer after calculate_distances()
+        waypoints (DataFrame): name, latitude, longitude and optionally cutoff_time,
+            defaults to the GPX file's <wpt> elements (analyzer.waypoints)
+        max_distance_m (float): Waypoints further than this from the route are skipped
+        index (TrackIndex): Reuse an existing index
+
+    Returns:
+        DataFrame: Distance (km), Nickname and Cutoff Time, one row per pass, later passes
+            of the same waypoint are named 'name (2)', 'name (3)', ...
+    """
+    waypoints = analyzer.waypoints if waypoints is None else waypoints
+    columns = ['Distance', 'Nickname', 'Cutoff Time']
+    if waypoints is None or len(waypoints) == 0:
+        return pd.DataFrame(columns=columns)
+
+    index = index or TrackIndex.from_analyzer(analyzer)
+    passes = index.snap(waypoints['latitude'].to_numpy(), waypoints['longitude'].to_numpy(),
+                        max_distance_m=max_distance_m)
+
+    names = waypoints['name'].fillna('').astype(str).str.strip().to_numpy()[passes['waypoint'].to_numpy(dtype=int)]
+    names = np.where(names == '', 'Waypoint', names)
+    pass_number = passes['pass_number'].to_numpy(dtype=int)
+    nicknames = [name if n == 1 else f"{name} ({n})" for name, n in zip(names, pass_number)]
+    cutoffs = waypoints['cutoff_time'].to_numpy()[passes['waypoint'].to_numpy(dtype=int)] \
+        if 'cutoff_time' in waypoints.columns else [None] * len(passes)
+
+    return pd.DataFrame({
+        'Distance': passes['total_distance'].to_numpy(dtype=float),
+        'Nickname': nicknames,
+        'Cutoff Time': cutoffs,
+    }, columns=columns)